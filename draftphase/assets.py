@@ -0,0 +1,161 @@
+import json
+import logging
+import mmap
+import os
+from pathlib import Path
+import struct
+import threading
+from typing import Iterable, cast
+
+from PIL import Image
+
+from draftphase.config import get_config
+from draftphase.maps import ENVIRONMENTS, FACTIONS, MAPS
+
+# Get the paths of every image asset used to render map images
+def get_asset_paths() -> list[Path]:
+    paths: list[Path] = []
+    for details in MAPS.values():
+        paths.append(details.tacmap)
+    for faction in FACTIONS.values():
+        paths.append(faction.images.default)
+        paths.append(faction.images.selected)
+    for environment in ENVIRONMENTS.values():
+        paths.append(environment.image)
+    # Several maps may share the same files
+    return list(dict.fromkeys(paths))
+
+# Holds every image asset in memory, so that each is only decoded once
+class AssetStore:
+    def __init__(self, paths: Iterable[Path] = (), lazy: bool = False):
+        self._images: dict[Path, Image.Image] = {}
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        if not lazy:
+            for path in paths:
+                self._load(path)
+
+    def _load(self, path: Path) -> Image.Image:
+        with self._lock:
+            im = self._images.get(path)
+            if im is not None:
+                return im
+
+            with Image.open(path) as f:
+                im = f.copy()
+
+            im.readonly = 1
+            self._images[path] = im
+            self.nbytes += im.width * im.height * len(im.getbands())
+            return im
+
+    def get(self, path: Path) -> Image.Image:
+        im = self._images.get(path)
+        if im is None:
+            im = self._load(path)
+        # A new image around the same pixel data, so that the store's own
+        # instance is never handed out
+        handle = im._new(im.im)
+        handle.readonly = 1
+        return handle
+
+    def __len__(self):
+        return len(self._images)
+
+_ASSET_STORE: AssetStore | None = None
+_ASSET_STORE_LOCK = threading.Lock()
+def get_asset_store() -> AssetStore:
+    global _ASSET_STORE
+    # Not `if not _ASSET_STORE`, since a lazy store starts out empty
+    if _ASSET_STORE is None:
+        with _ASSET_STORE_LOCK:
+            if _ASSET_STORE is None:
+                config = get_config().images
+                _ASSET_STORE = AssetStore(get_asset_paths(), lazy=config.lazy_assets)
+                if not config.lazy_assets:
+                    logging.info(
+                        "Loaded %s image assets (%.1f MB)",
+                        len(_ASSET_STORE),
+                        _ASSET_STORE.nbytes / 1024 / 1024,
+                    )
+    return _ASSET_STORE
+
+def get_asset_store_stats():
+    if _ASSET_STORE is None:
+        return None
+    return {
+        "images": len(_ASSET_STORE),
+        "size_mb": _ASSET_STORE.nbytes / 1024 / 1024,
+    }
+
+def open_asset(path: Path) -> Image.Image:
+    return get_asset_store().get(path)
+
+
+ASSET_PACK_MAGIC = b"DPAK"
+ASSET_PACK_VERSION = 1
+ASSET_PACK_ALIGN = 64
+ASSET_PACK_HEADER = struct.Struct("<4sII")
+
+# The name of a baked asset, its image, and where to place it on a map image
+PackedAsset = tuple[str, Image.Image, tuple[int, int]]
+
+# Write baked assets to a single file
+def write_asset_pack(path: Path, digest: str, assets: Iterable[PackedAsset]):
+    index: dict[str, list] = {}
+    chunks: list[bytes] = []
+    offset = 0
+    for name, im, dest in assets:
+        data = im.tobytes()
+        padding = -len(data) % ASSET_PACK_ALIGN
+        index[name] = [offset, im.width, im.height, im.mode, dest[0], dest[1]]
+        chunks.append(data + bytes(padding))
+        offset += len(data) + padding
+
+    index_data = json.dumps({"digest": digest, "assets": index}).encode()
+    index_data += b" " * (-(ASSET_PACK_HEADER.size + len(index_data)) % ASSET_PACK_ALIGN)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(ASSET_PACK_HEADER.pack(ASSET_PACK_MAGIC, ASSET_PACK_VERSION, len(index_data)))
+        f.write(index_data)
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp_path, path)
+
+# A file of baked assets, written by `scripts.bake_assets`
+class AssetPack:
+    def __init__(self, path: Path):
+        with path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, index_size = ASSET_PACK_HEADER.unpack_from(self._mmap)
+        if magic != ASSET_PACK_MAGIC or version != ASSET_PACK_VERSION:
+            raise ValueError("Not a supported asset pack")
+
+        index = json.loads(self._mmap[ASSET_PACK_HEADER.size:ASSET_PACK_HEADER.size + index_size])
+        self.digest: str = index["digest"]
+        self._index: dict[str, list] = index["assets"]
+        self._data_offset = ASSET_PACK_HEADER.size + index_size
+        self._buffer = memoryview(self._mmap)
+        self.nbytes = len(self._mmap)
+
+    def get(self, name: str) -> tuple[Image.Image, tuple[int, int]] | None:
+        entry = self._index.get(name)
+        if entry is None:
+            return None
+
+        offset, width, height, mode, x, y = entry
+        start = self._data_offset + offset
+        size = width * height * Image.getmodebands(mode)
+        # Pillow accepts any buffer here, but is only typed to take bytes
+        data = cast(bytes, self._buffer[start:start + size])
+        im = Image.frombuffer(mode, (width, height), data, "raw", mode, 0, 1)
+        return im, (x, y)
+
+    def __contains__(self, name: str):
+        return name in self._index
+
+    def __len__(self):
+        return len(self._index)
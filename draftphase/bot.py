@@ -5,6 +5,9 @@ from pathlib import Path
 from discord import Intents
 from discord.ext import commands
 
+from draftphase.config import get_config
+from draftphase.utils import safe_create_task
+
 DISCORD_COGS_PATH = Path("draftphase/cogs")
 
 class Bot(commands.Bot):
@@ -25,6 +28,22 @@ class Bot(commands.Bot):
             PollCastVoteButton,
         )
 
+        images_config = get_config().images
+        from draftphase.images import get_asset_pack, load_assets
+        if images_config.render_backend == "thread":
+            await asyncio.to_thread(load_assets)
+        else:
+            # Renders happen in worker processes, which load their own assets
+            await asyncio.to_thread(get_asset_pack)
+
+        if images_config.warm_up:
+            from draftphase.images import warm_up_map_images
+            safe_create_task(
+                warm_up_map_images(images_config.warm_up_maps),
+                err_msg="Failed to warm up map images",
+                name="warm_up_map_images",
+            )
+
 INTENTS = Intents.default()
 INTENTS.members = True
 
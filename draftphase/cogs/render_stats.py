@@ -0,0 +1,43 @@
+from io import BytesIO
+import json
+import logging
+from discord import File, Interaction, app_commands
+from discord.ext import commands, tasks
+
+from draftphase.bot import Bot
+from draftphase.config import get_config
+from draftphase.images import get_render_stats, summarize_render_stats
+
+class RenderStatsCog(commands.Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+
+        interval = get_config().images.stats_log_interval
+        if interval:
+            self.render_stats_logger.change_interval(minutes=interval)
+            self.render_stats_logger.start()
+
+    async def cog_unload(self):
+        self.render_stats_logger.cancel()
+
+    @app_commands.command(name="render-stats", description="Show statistics of the image renderer")
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    async def render_stats(self, interaction: Interaction):
+        stats = get_render_stats()
+        await interaction.response.send_message(
+            summarize_render_stats(stats),
+            file=File(BytesIO(json.dumps(stats, indent=2).encode()), filename="render_stats.json"),
+            ephemeral=True,
+        )
+
+    @tasks.loop(minutes=15)
+    async def render_stats_logger(self):
+        logging.info("Render stats: %s", summarize_render_stats(get_render_stats()))
+
+    @render_stats_logger.before_loop
+    async def render_stats_logger_before_loop(self):
+        await self.bot.wait_until_ready()
+
+async def setup(bot: Bot):
+    await bot.add_cog(RenderStatsCog(bot))
@@ -1,6 +1,6 @@
 from enum import Enum
 from pathlib import Path
-from typing import Any, Self, Sequence, TypeAlias
+from typing import Any, Literal, Self, Sequence, TypeAlias
 from pydantic import BaseModel, field_validator, model_validator
 from PIL import Image
 import yaml
@@ -21,6 +21,9 @@ class Bot(BaseModel, frozen=True):
     organiser_role_id: int | None
     max_num_offers: int
     default_stream_delay: int | None
+    progressive_updates: bool = False
+    game_message_layout: Literal["separate", "combined"] = "separate"
+    image_storage_channel_id: int | None = None
 
     @field_validator("max_num_offers")
     @classmethod
@@ -29,6 +32,59 @@ class Bot(BaseModel, frozen=True):
             raise ValueError("Must be greater than 0")
         return v
 
+class ImageEncoding(BaseModel, frozen=True):
+    format: Literal["png", "webp"] = "png"
+    compress_level: int = 6
+    quality: int = 90
+    lossless: bool = False
+    quantize: bool = False
+    max_size_kb: int | None = None
+
+    @field_validator("compress_level")
+    @classmethod
+    def validate_compress_level(cls, v: int):
+        if not 0 <= v <= 9:
+            raise ValueError("Must be between 0 and 9")
+        return v
+
+    @field_validator("quality")
+    @classmethod
+    def validate_quality(cls, v: int):
+        if not 0 <= v <= 100:
+            raise ValueError("Must be between 0 and 100")
+        return v
+
+class Images(BaseModel, frozen=True):
+    cache_dir: Path | None = Path("cache/images")
+    cache_max_size_mb: int = 1024
+    warm_up: bool = False
+    warm_up_maps: list[str] | None = None
+    render_workers: int | None = None
+    render_backend: Literal["thread", "process"] = "thread"
+    map_image_cache_size_mb: int = 128
+    sheet_cache_size_mb: int = 64
+    shared_cache_size_mb: int = 0
+    use_numpy: bool = False
+    lazy_assets: bool = False
+    asset_pack: Path | None = Path("cache/assets.pack")
+    timings: bool = False
+    stats_log_interval: int = 15
+    encoding: ImageEncoding = ImageEncoding()
+
+    @field_validator("cache_max_size_mb", "map_image_cache_size_mb", "sheet_cache_size_mb", "shared_cache_size_mb", "stats_log_interval")
+    @classmethod
+    def validate_cache_size(cls, v: int):
+        if v < 0:
+            raise ValueError("Must be 0 or greater")
+        return v
+
+    @field_validator("render_workers")
+    @classmethod
+    def validate_render_workers(cls, v: int | None):
+        if v is not None and v < 1:
+            raise ValueError("Must be greater than 0")
+        return v
+
 class Team(BaseModel, frozen=True):
     rep_role_id: int
     public_role_id: int
@@ -88,6 +144,7 @@ class Map(BaseModel, frozen=True):
 
 class Config(BaseModel):
     bot: Bot
+    images: Images = Images()
     teams: dict[str, Team]
     middlegrounds: dict[str, list[str]]
     environments: dict[str, Environment]
@@ -117,6 +174,15 @@ class Config(BaseModel):
                 ))
         return self
 
+    @model_validator(mode="after")
+    def check_warm_up_map_references(self) -> Self:
+        for key in self.images.warm_up_maps or ():
+            if key not in self.maps:
+                raise ValueError("Unknown warm-up map %s, expected one of %s" % (
+                    key, list(self.maps.keys())
+                ))
+        return self
+
     @field_validator("middlegrounds", mode="before")
     @classmethod
     def replace_middleground_wildcards(cls, v: Any):
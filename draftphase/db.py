@@ -112,3 +112,13 @@ def create_tables():
         cur.execute("""
         CREATE UNIQUE INDEX IF NOT EXISTS idx_poll_votes_role_id_poll_id ON poll_votes (role_id, poll_id)
         """)
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS image_urls (
+            digest TEXT(64) PRIMARY KEY,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            url TEXT NOT NULL,
+            expires_at INTEGER
+        )""")
@@ -1,10 +1,13 @@
 from datetime import datetime, timedelta
 import functools
+import hashlib
 import logging
+import re
 
 from typing import Callable, Optional, Any, Awaitable, Sequence
 from typing_extensions import TypedDict, NotRequired
 
+from cachetools import LRUCache
 import discord
 from discord import Attachment, Embed, File, ui, app_commands, Interaction, ButtonStyle, Emoji, PartialEmoji, SelectOption
 from discord.ext import commands
@@ -218,3 +221,74 @@ class MessagePayload(TypedDict):
     content: NotRequired[str | None]
     embeds: NotRequired[Sequence[Embed]]
     view: NotRequired[ui.View]
+
+# The attachments last put on a message, by the hash of their contents
+MESSAGE_ATTACHMENTS: LRUCache[int, dict[str, Attachment]] = LRUCache(maxsize=1024)
+
+# Rendered images are named after a hash of their contents, see
+# `RenderedImage.get_file_name`
+CONTENT_HASH_FILE_NAME = re.compile(r"_([0-9a-f]{16})\.\w+$")
+
+# Get a hash of the contents of a file
+def get_file_digest(file: File):
+    match = CONTENT_HASH_FILE_NAME.search(file.filename)
+    if match:
+        return match[1]
+
+    pos = file.fp.tell()
+    digest = hashlib.sha256(file.fp.read()).hexdigest()
+    file.fp.seek(pos)
+    return digest
+
+def get_file_digests(files: Sequence[File]):
+    return {file.filename: get_file_digest(file) for file in files}
+
+# Replace files that are already attached to the message with the existing attachment
+def reuse_attachments(
+    message_id: int,
+    embeds: Sequence[Embed],
+    files: Sequence[File | Attachment],
+) -> tuple[list[Attachment | File], dict[str, str]]:
+    existing = MESSAGE_ATTACHMENTS.get(message_id, {})
+    used: set[str] = set()
+    attachments: list[Attachment | File] = []
+    digests: dict[str, str] = {}
+    for file in files:
+        if isinstance(file, Attachment):
+            # Already attached to the message
+            attachments.append(file)
+            for digest, attachment in existing.items():
+                if attachment.filename == file.filename:
+                    digests[file.filename] = digest
+            continue
+
+        digest = get_file_digest(file)
+        attachment = existing.get(digest)
+        if attachment is None or digest in used:
+            attachments.append(file)
+            digests[file.filename] = digest
+            continue
+
+        used.add(digest)
+        attachments.append(attachment)
+        digests[attachment.filename] = digest
+
+        old_url = f"attachment://{file.filename}"
+        new_url = f"attachment://{attachment.filename}"
+        for embed in embeds:
+            if embed.image.url == old_url:
+                embed.set_image(url=new_url)
+            if embed.thumbnail.url == old_url:
+                embed.set_thumbnail(url=new_url)
+
+    return attachments, digests
+
+def remember_attachments(message: discord.Message, digests: dict[str, str]):
+    MESSAGE_ATTACHMENTS[message.id] = {
+        digests[attachment.filename]: attachment
+        for attachment in message.attachments
+        if attachment.filename in digests
+    }
+
+def forget_attachments(message_id: int):
+    MESSAGE_ATTACHMENTS.pop(message_id, None)
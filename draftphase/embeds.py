@@ -1,27 +1,60 @@
-from datetime import datetime, timezone
-import itertools
-from typing import Literal
-from discord import Client, ui, Colour, Embed, File, TextChannel
+import asyncio
+import logging
+from typing import Literal, Mapping, Sequence
+from urllib.parse import urlparse
+from discord import Attachment, Client, ui, Colour, Embed, File, TextChannel
 import discord
 from discord.utils import format_dt
 
-from draftphase.discord_utils import MessagePayload, View
-from draftphase.game import Game
-from draftphase.images import get_single_offer_image, offers_to_image
+from draftphase.config import get_config
+from draftphase.discord_utils import MessagePayload, View, get_file_digests, remember_attachments, reuse_attachments
+from draftphase.game import Game, Offer
+from draftphase.image_storage import get_stored_image_urls
+from draftphase.images import (
+    THUMBNAIL_SIZE, RenderedImage, board_to_image, get_single_offer_image, get_tile_key, offers_to_image,
+)
 from draftphase.maps import Environment, LayoutType, MapDetails
-
-FILE_COUNTER = itertools.count()
-
-def get_file_name(name: str):
-    timestamp = int(datetime.now(timezone.utc).timestamp())
-    count = next(FILE_COUNTER)
-    fn = f"{name}_{timestamp}_{count}.png"
-    return fn
-
-async def get_game_embeds(client: Client, game: Game) -> tuple[MessagePayload, list[File]]:
+from draftphase.utils import safe_create_task
+
+# Add an image to the files of a message, and get the URL with which embeds can refer to it
+def attach_image(
+    files: list[File | Attachment],
+    name: str,
+    im: RenderedImage | None,
+    previous_attachments: Sequence[Attachment] = (),
+    stored_urls: Mapping[str, str] | None = None,
+    previous_urls: Sequence[str] = (),
+) -> str | None:
+    if im and stored_urls and im.digest in stored_urls:
+        return stored_urls[im.digest]
+
+    if im:
+        fn = im.get_file_name(name)
+        files.append(File(im.open(), filename=fn))
+        return f"attachment://{fn}"
+
+    for attachment in previous_attachments:
+        if attachment.filename.startswith(f"{name}_"):
+            files.append(attachment)
+            return f"attachment://{attachment.filename}"
+
+    for url in previous_urls:
+        if urlparse(url).path.rsplit("/", 1)[-1].startswith(f"{name}_"):
+            return url
+
+    return None
+
+# Get the contents of a game message
+async def get_game_embeds(
+    client: Client,
+    game: Game,
+    render_images: bool = True,
+    previous_attachments: Sequence[Attachment] = (),
+    previous_embeds: Sequence[Embed] = (),
+) -> tuple[MessagePayload, list[File | Attachment]]:
     payload: MessagePayload = {}
     embeds: list[Embed] = []
-    files: list[File] = []
+    files: list[File | Attachment] = []
 
     channel = client.get_channel(game.channel_id)
     if not channel:
@@ -90,23 +123,102 @@ async def get_game_embeds(client: Client, game: Game) -> tuple[MessagePayload, l
     
     embeds.append(embed)
 
+    team_name = team1_name if game.turn() == 1 else team2_name
+    single_offer: Offer | None = None
+    if game.is_choosing_advantage():
+        single_offer_comment = None
+    elif game.is_done():
+        single_offer = game.get_accepted_offer()
+        assert single_offer is not None
+        single_offer_comment = f"Accepted by {team_name}"
+    elif game.is_offer_available():
+        single_offer = game.offers[-1]
+        single_offer_comment = f"Offered to {team_name}"
+    else:
+        single_offer_comment = f"{team_name} is offering..."
+
+    team_idxs: tuple[Literal[1, 2], Literal[1, 2]] = (1, 2)
+    sheets = [
+        (
+            game.get_offers_for_team_idx(team_idx),
+            game.get_max_num_offers_for_team_idx(team_idx),
+            not game.is_done() and team_idx != game.turn(opponent=game.is_offer_available()),
+            (game.channel_id, team_idx),
+        )
+        for team_idx in team_idxs
+    ]
+
+    combined = get_config().bot.game_message_layout == "combined"
+    if combined:
+        im_coros = [board_to_image(
+            sheets,
+            flip_sides=game.flip_sides or False,
+            offer_tile_key=get_tile_key(
+                single_offer.get_map_details(),
+                single_offer.layout,
+                single_offer.get_environment(),
+                None,
+            ) if single_offer else None,
+            show_offer=single_offer_comment is not None,
+        )]
+    else:
+        # Submit all images of the message at once, so that they are
+        # rendered concurrently rather than one after the other
+        im_coros = [
+            offers_to_image(
+                offers,
+                max_num_offers=max_num_offers,
+                grayscaled=grayscaled,
+                flip_sides=game.flip_sides or False,
+                sheet_id=sheet_id,
+            )
+            for offers, max_num_offers, grayscaled, sheet_id in sheets
+        ]
+        if single_offer:
+            im_coros.append(get_single_offer_embed_image(
+                map_details=single_offer.get_map_details(),
+                environment=single_offer.get_environment(),
+                layout=single_offer.layout,
+            ))
+        elif single_offer_comment:
+            im_coros.append(get_single_offer_embed_image())
+
+    ims: list[RenderedImage | None]
+    if render_images:
+        ims = list(await asyncio.gather(*im_coros))
+    else:
+        for coro in im_coros:
+            coro.close()
+        ims = [None] * len(im_coros)
+
+    # The board replaces the images of the sheets and the single offer
+    named_ims: dict[str, RenderedImage | None]
+    if combined:
+        named_ims = {"board": ims[0]}
+    else:
+        named_ims = {"team1_offers": ims[0], "team2_offers": ims[1], "offer": ims[2] if len(ims) > 2 else None}
+    stored_urls = await get_stored_image_urls(named_ims)
+    previous_urls = [
+        url
+        for previous_embed in previous_embeds
+        for url in (previous_embed.image.url, previous_embed.thumbnail.url)
+        if url
+    ]
+
     team_idx: Literal[1, 2]
-    for team_idx, team_name in ((1, team1_name), (2, team2_name)): # type: ignore
+    for team_idx, team_name in zip(team_idxs, (team1_name, team2_name)):
         offers = game.get_offers_for_team_idx(team_idx)
         max_num_offers = game.get_max_num_offers_for_team_idx(team_idx)
 
-        im = await offers_to_image(
-            offers,
-            max_num_offers=max_num_offers,
-            grayscaled=(not game.is_done() and team_idx != game.turn(opponent=game.is_offer_available())),
-            flip_sides=game.flip_sides or False,
-        )
-        fn = get_file_name(f"team{team_idx}_offers")
-        file = File(im, filename=fn)
-
         embed = Embed(description=f"Maps offered by **{team_name}** ({len(offers)}/{max_num_offers})")
-        embed.set_image(url=f"attachment://{fn}")
         assert embed.description is not None
+        if combined:
+            embed.description += "\n-# **Board:** Upper sheet" if team_idx == 1 else "\n-# **Board:** Lower sheet"
+        else:
+            name = f"team{team_idx}_offers"
+            url = attach_image(files, name, named_ims[name], previous_attachments, stored_urls, previous_urls)
+            if url:
+                embed.set_image(url=url)
 
         if not game.is_done() and team_idx == game.turn():
             embed.color = Colour(0xffffff)
@@ -132,7 +244,6 @@ async def get_game_embeds(client: Client, game: Game) -> tuple[MessagePayload, l
                     embed.description += f"\n-# **First offer:** You get to make the first offer"
 
         embeds.append(embed)
-        files.append(file)
     
     team_name = team1_name if game.turn() == 1 else team2_name
     if game.is_choosing_advantage():
@@ -148,36 +259,30 @@ async def get_game_embeds(client: Client, game: Game) -> tuple[MessagePayload, l
                 value=f"They get to choose between either of the below two options:\n\n> -# **Offer advantage**\n> Your opponent cannot accept past offers.\n\n> -# **Server advantage**\n> Your team gets the preferred server location. You offer first.",
             )
 
-        embeds.append(embed)
-    elif game.is_done():
-        offer = game.get_accepted_offer()
-        assert offer is not None
-        embed, file = await get_single_offer_embed(
-            map_details=offer.get_map_details(),
-            environment=offer.get_environment(),
-            midpoint_idx=offer.layout[1],
-            layout=offer.layout,
-            comment=f"Accepted by {team_name}"
-        )
-        embeds.append(embed)
-        files.append(file)
-    elif game.is_offer_available():
-        offer = game.offers[-1]
-        embed, file = await get_single_offer_embed(
-            map_details=offer.get_map_details(),
-            environment=offer.get_environment(),
-            midpoint_idx=offer.layout[1],
-            layout=offer.layout,
-            comment=f"Offered to {team_name}"
-        )
-        embeds.append(embed)
-        files.append(file)
     else:
-        embed, file = await get_single_offer_embed(
-            comment=f"{team_name} is offering..."
-        )
-        embeds.append(embed)
-        files.append(file)
+        if single_offer:
+            embed = build_single_offer_embed(
+                map_details=single_offer.get_map_details(),
+                environment=single_offer.get_environment(),
+                midpoint_idx=single_offer.layout[1],
+                comment=single_offer_comment,
+            )
+        else:
+            embed = build_single_offer_embed(comment=single_offer_comment)
+
+        # Unlike the sheets, the previous offer is not kept while the new one
+        # is rendered, since it would not match the text next to it
+        if not combined:
+            url = attach_image(files, "offer", named_ims["offer"], stored_urls=stored_urls)
+            if url:
+                embed.set_thumbnail(url=url)
+
+    if combined:
+        # The board shows the offer as well
+        url = attach_image(files, "board", named_ims["board"], stored_urls=stored_urls)
+        if url:
+            embed.set_image(url=url)
+    embeds.append(embed)
 
     if not game.is_done():
         from draftphase.views.open_controls import GetControlsButton
@@ -213,17 +318,52 @@ async def get_single_offer_embed(
     layout: LayoutType | None = None,
     comment: str | None = None,
     selected_team_id: Literal[1, 2] | None = None,
+):
+    im = await get_single_offer_embed_image(
+        map_details=map_details,
+        layout=layout,
+        selected_team_id=selected_team_id,
+        environment=environment,
+    )
+    embed = build_single_offer_embed(
+        map_details=map_details,
+        environment=environment,
+        midpoint_idx=midpoint_idx,
+        comment=comment,
+    )
+
+    stored_urls = await get_stored_image_urls({"offer": im})
+    if im.digest in stored_urls:
+        embed.set_thumbnail(url=stored_urls[im.digest])
+        return embed, None
+
+    fn = im.get_file_name("offer")
+    file = File(im.open(), filename=fn)
+    embed.set_thumbnail(url=f"attachment://{fn}")
+    return embed, file
+
+async def get_single_offer_embed_image(
+    map_details: MapDetails | None = None,
+    environment: Environment | None = None,
+    layout: LayoutType | None = None,
+    selected_team_id: Literal[1, 2] | None = None,
 ):
     if not map_details:
-        im = await get_single_offer_image()
-    else:
-        im = await get_single_offer_image(
-            details=map_details,
-            layout=layout,
-            environment=environment,
-            selected_team_id=selected_team_id,
-        )
+        return await get_single_offer_image(size=THUMBNAIL_SIZE)
+    return await get_single_offer_image(
+        details=map_details,
+        layout=layout,
+        environment=environment,
+        selected_team_id=selected_team_id,
+        size=THUMBNAIL_SIZE,
+    )
 
+def build_single_offer_embed(
+    map_details: MapDetails | None = None,
+    environment: Environment | None = None,
+    midpoint_idx: int | None = None,
+    comment: str | None = None,
+):
     if map_details:
         map_name = map_details.name
     else:
@@ -253,12 +393,7 @@ async def get_single_offer_embed(
         name="​",
         value=f"-# **Midpoint**\n{midpoint_name}",
     )
-
-    fn = get_file_name("offer")
-    file = File(im, filename=fn)
-    embed.set_thumbnail(url=f"attachment://{fn}")
-    
-    return embed, file
+    return embed
 
 
 async def create_game(client: Client, channel: TextChannel, team1_id: int, team2_id: int, subtitle: str | None = None):
@@ -273,27 +408,93 @@ async def create_game(client: Client, channel: TextChannel, team1_id: int, team2
 
     return game
 
+# Images that finish rendering within this many seconds are sent along with
+# the rest of the game message, instead of in a separate edit
+PROGRESSIVE_UPDATE_DELAY = 0.2
+
+GAME_MESSAGE_GENERATIONS: dict[int, int] = {}
+GAME_MESSAGE_LOCKS: dict[int, asyncio.Lock] = {}
+
+# Send or edit the public message of a game
 async def send_or_edit_game_message(client: Client, game: Game):
     channel = client.get_channel(game.channel_id)
     if not isinstance(channel, TextChannel):
         raise ValueError("Channel not found")
 
-    payload, files = await get_game_embeds(client, game)
-        
-    message = None
-    if game.message_id:
-        try:
-            message = await channel.fetch_message(game.message_id)
-        except discord.NotFound:
-            pass
-        
+    # Every update replaces all earlier ones, including their image edits
+    # that might still be waiting on renders.
+    generation = GAME_MESSAGE_GENERATIONS.get(game.channel_id, 0) + 1
+    GAME_MESSAGE_GENERATIONS[game.channel_id] = generation
+    lock = GAME_MESSAGE_LOCKS.setdefault(game.channel_id, asyncio.Lock())
+
+    render_task = asyncio.ensure_future(get_game_embeds(client, game))
+    try:
+        message = None
+        if game.message_id:
+            try:
+                message = await channel.fetch_message(game.message_id)
+            except discord.NotFound:
+                pass
+
+        if get_config().bot.progressive_updates and not render_task.done():
+            await asyncio.wait([render_task], timeout=PROGRESSIVE_UPDATE_DELAY)
+
+        if not get_config().bot.progressive_updates or render_task.done():
+            payload, files = await render_task
+            async with lock:
+                return await _send_or_edit_game_message(channel, game, message, payload, files)
+
+        payload, files = await get_game_embeds(
+            client, game,
+            render_images=False,
+            previous_attachments=message.attachments if message else (),
+            previous_embeds=message.embeds if message else (),
+        )
+        async with lock:
+            message = await _send_or_edit_game_message(channel, game, message, payload, files)
+    except BaseException:
+        render_task.cancel()
+        raise
+
+    safe_create_task(
+        _attach_game_message_images(channel, game, message, render_task, generation),
+        err_msg="Failed to attach images to game message",
+        name=f"attach_game_message_images_{game.channel_id}",
+    )
+    return message
+
+async def _attach_game_message_images(
+    channel: TextChannel,
+    game: Game,
+    message: discord.Message,
+    render_task: asyncio.Future[tuple[MessagePayload, list[File | Attachment]]],
+    generation: int,
+):
+    payload, files = await render_task
+    async with GAME_MESSAGE_LOCKS[game.channel_id]:
+        if GAME_MESSAGE_GENERATIONS.get(game.channel_id) != generation:
+            logging.debug("Dropping outdated images of game message %s", message.id)
+            return
+        await _send_or_edit_game_message(channel, game, message, payload, files)
+
+async def _send_or_edit_game_message(
+    channel: TextChannel,
+    game: Game,
+    message: discord.Message | None,
+    payload: MessagePayload,
+    files: list[File | Attachment],
+):
     if message:
         payload.setdefault("view", None) # type: ignore
-        await message.edit(**payload, attachments=files)
+        attachments, digests = reuse_attachments(message.id, payload.get("embeds", []), files)
+        message = await message.edit(**payload, attachments=attachments)
     else:
-        message = await channel.send(**payload, files=files)
+        new_files = [file for file in files if isinstance(file, File)]
+        digests = get_file_digests(new_files)
+        message = await channel.send(**payload, files=new_files)
         game.message_id = message.id
         game.save()
+    remember_attachments(message, digests)
 
     return message
 
@@ -0,0 +1,230 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import logging
+from typing import Mapping, Self, Sequence
+from urllib.parse import parse_qs, urlparse
+
+from cachetools import LRUCache
+import discord
+from discord import File, TextChannel
+from pydantic import BaseModel
+
+from draftphase.bot import DISCORD_BOT
+from draftphase.config import get_config
+from draftphase.db import get_cursor
+from draftphase.images import RenderedImage
+
+# Stored URLs that expire within this time are refreshed before being used
+URL_EXPIRY_MARGIN = timedelta(hours=1)
+MAX_FILES_PER_MESSAGE = 10
+
+# Get when a signed Discord CDN URL expires, from its `ex` parameter
+def get_url_expiry(url: str) -> datetime | None:
+    try:
+        ex = parse_qs(urlparse(url).query)["ex"][0]
+        return datetime.fromtimestamp(int(ex, 16), tz=timezone.utc)
+    except (KeyError, ValueError):
+        return None
+
+class StoredImage(BaseModel):
+    digest: str
+    channel_id: int
+    message_id: int
+    filename: str
+    url: str
+    expires_at: datetime | None
+
+    @classmethod
+    def create(cls, digest: str, message: discord.Message, attachment: discord.Attachment):
+        self = cls(
+            digest=digest,
+            channel_id=message.channel.id,
+            message_id=message.id,
+            filename=attachment.filename,
+            url=attachment.url,
+            expires_at=get_url_expiry(attachment.url),
+        )
+        self.save()
+        return self
+
+    @classmethod
+    def _load_row(cls, data: tuple):
+        return cls(
+            digest=data[0],
+            channel_id=data[1],
+            message_id=data[2],
+            filename=data[3],
+            url=data[4],
+            expires_at=datetime.fromtimestamp(data[5], tz=timezone.utc) if data[5] else None,
+        )
+
+    @classmethod
+    def load(cls, digest: str) -> Self | None:
+        with get_cursor() as cur:
+            cur.execute("SELECT * FROM image_urls WHERE digest = ?", (digest,))
+            data = cur.fetchone()
+        if not data:
+            return None
+        return cls._load_row(data)
+
+    def save(self):
+        data = self.model_dump()
+        data["expires_at"] = int(self.expires_at.timestamp()) if self.expires_at else None
+        with get_cursor() as cur:
+            cur.execute(
+                """
+                INSERT OR REPLACE INTO image_urls(digest, channel_id, message_id, filename, url, expires_at)
+                VALUES (:digest, :channel_id, :message_id, :filename, :url, :expires_at)
+                """,
+                data
+            )
+
+    def delete(self):
+        with get_cursor() as cur:
+            cur.execute("DELETE FROM image_urls WHERE digest = ?", (self.digest,))
+
+    def is_expiring(self):
+        if not self.expires_at:
+            return False
+        return self.expires_at - URL_EXPIRY_MARGIN <= datetime.now(tz=timezone.utc)
+
+# Uploads every image once to a storage channel, so that messages can refer to its URL
+class ImageStorage:
+    def __init__(self, channel_id: int):
+        self.channel_id = channel_id
+        self._images: LRUCache[str, StoredImage] = LRUCache(maxsize=4096)
+        # Uploads happen one at a time, so that two messages showing the
+        # same new image do not both upload it
+        self._lock = asyncio.Lock()
+
+    def _get(self, digest: str):
+        stored = self._images.get(digest)
+        if stored is None:
+            stored = StoredImage.load(digest)
+            if stored is not None:
+                self._images[digest] = stored
+        return stored
+
+    async def _get_channel(self) -> TextChannel:
+        channel = DISCORD_BOT.get_channel(self.channel_id) or await DISCORD_BOT.fetch_channel(self.channel_id)
+        if not isinstance(channel, TextChannel):
+            raise ValueError("Image storage channel is not a text channel")
+        return channel
+
+    # Get the URLs of images by their digest, uploading those that are not stored yet
+    async def get_urls(self, images: Mapping[str, RenderedImage | None]) -> dict[str, str]:
+        urls: dict[str, str] = {}
+        pending: dict[str, tuple[str, RenderedImage]] = {}
+        for name, image in images.items():
+            if image is None or image.digest in urls:
+                continue
+            stored = self._get(image.digest)
+            if stored and not stored.is_expiring():
+                urls[image.digest] = stored.url
+            else:
+                pending[image.digest] = (name, image)
+
+        if pending:
+            async with self._lock:
+                # Another message may have stored some of them in the meantime
+                expiring: list[StoredImage] = []
+                missing: list[tuple[str, RenderedImage]] = []
+                for digest, named_image in pending.items():
+                    stored = self._get(digest)
+                    if stored is None:
+                        missing.append(named_image)
+                    elif stored.is_expiring():
+                        expiring.append(stored)
+                    else:
+                        urls[digest] = stored.url
+
+                for stored in await self._refresh(expiring):
+                    if stored.is_expiring():
+                        missing.append(pending[stored.digest])
+                    else:
+                        urls[stored.digest] = stored.url
+
+                for stored in await self._upload(missing):
+                    urls[stored.digest] = stored.url
+
+        return urls
+
+    async def _refresh(self, images: Sequence[StoredImage]) -> list[StoredImage]:
+        if not images:
+            return []
+
+        channel = await self._get_channel()
+        by_message: dict[int, list[StoredImage]] = {}
+        for stored in images:
+            by_message.setdefault(stored.message_id, []).append(stored)
+
+        refreshed: list[StoredImage] = []
+        for message_id, stored_images in by_message.items():
+            try:
+                message = await channel.fetch_message(message_id)
+            except discord.NotFound:
+                message = None
+
+            attachments = {attachment.filename: attachment for attachment in message.attachments} if message else {}
+            for stored in stored_images:
+                attachment = attachments.get(stored.filename)
+                if message and attachment:
+                    stored = StoredImage.create(stored.digest, message, attachment)
+                    self._images[stored.digest] = stored
+                else:
+                    logging.info("Stored image %s no longer exists, uploading it again", stored.filename)
+                    stored.delete()
+                    self._images.pop(stored.digest, None)
+                refreshed.append(stored)
+
+        logging.debug("Refreshed the URLs of %s stored images", len(images))
+        return refreshed
+
+    async def _upload(self, images: Sequence[tuple[str, RenderedImage]]) -> list[StoredImage]:
+        if not images:
+            return []
+
+        channel = await self._get_channel()
+        uploaded: list[StoredImage] = []
+        for i in range(0, len(images), MAX_FILES_PER_MESSAGE):
+            chunk = images[i:i + MAX_FILES_PER_MESSAGE]
+            digests = {image.get_file_name(name): image.digest for name, image in chunk}
+            message = await channel.send(files=[
+                File(image.open(), filename=image.get_file_name(name))
+                for name, image in chunk
+            ])
+            for attachment in message.attachments:
+                digest = digests.get(attachment.filename)
+                if digest:
+                    stored = StoredImage.create(digest, message, attachment)
+                    self._images[digest] = stored
+                    uploaded.append(stored)
+
+        logging.debug(
+            "Uploaded %s images (%.1f KB) to the storage channel",
+            len(images),
+            sum(len(image.data) for _, image in images) / 1024,
+        )
+        return uploaded
+
+_IMAGE_STORAGE: ImageStorage | None = None
+def get_image_storage() -> ImageStorage | None:
+    global _IMAGE_STORAGE
+    channel_id = get_config().bot.image_storage_channel_id
+    if not channel_id:
+        return None
+    if not _IMAGE_STORAGE:
+        _IMAGE_STORAGE = ImageStorage(channel_id)
+    return _IMAGE_STORAGE
+
+# Get the URLs of images in the storage channel by their digest
+async def get_stored_image_urls(images: Mapping[str, RenderedImage | None]) -> dict[str, str]:
+    storage = get_image_storage()
+    if not storage:
+        return {}
+
+    try:
+        return await storage.get_urls(images)
+    except (discord.HTTPException, ValueError):
+        logging.warning("Failed to store images, attaching them instead", exc_info=True)
+        return {}
@@ -1,54 +1,328 @@
 import asyncio
-from concurrent.futures import Future, ThreadPoolExecutor
-from enum import Enum
+from collections import OrderedDict
+import contextlib
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextvars import ContextVar
+from enum import Enum, IntEnum
+import functools
+import hashlib
+import heapq
 from io import BytesIO
+import itertools
+import logging
 import math
+import multiprocessing
+import os
 from pathlib import Path
-from typing import Literal, Sequence
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Hashable, Iterable, Literal, NamedTuple, Sequence, TypeAlias, TypeVar
 from cachetools import LRUCache, cached
+from cachetools.keys import hashkey
 from discord import Colour
 from PIL import Image, ImageDraw, ImageFont, ImageEnhance
 
-from draftphase.config import Orientation
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from draftphase.assets import AssetPack, get_asset_paths, get_asset_store, get_asset_store_stats, open_asset
+from draftphase.config import ImageEncoding, Orientation, get_config
 from draftphase.game import Offer
-from draftphase.maps import Environment, Faction, MapDetails, LayoutType
+from draftphase.maps import ENVIRONMENTS, LAYOUT_COMBINATIONS, MAPS, Environment, Faction, MapDetails, LayoutType
+from draftphase.shared_cache import SLOT_KEY_SIZE, SharedTileCache
 
 IM_SIZE = 400
+THUMBNAIL_SIZE = 160
 IM_STACK_GAP_SIZE = int(0.1 * IM_SIZE)
 OBJECTIVE_LINE_THICKNESS = int(0.025 * IM_SIZE)
 PLACEHOLDER_ROUND_RADIUS = int(0.15 * IM_SIZE)
 
 ARIAL_BOLD_TTF = Path("assets/fonts/Arial Bold.ttf")
 
+# Bump this whenever the output of `render_map_image` changes, so that
+# images cached on disk by older versions are no longer used.
+RENDER_VERSION = 2
+
 class Colors(Enum):
     OBJECTIVE_LINE = Colour(0x11e72b).to_rgb()
     PLACEHOLDER_BG = Colour(0x202225).to_rgb()
     PLACEHOLDER_TEXT = Colour(0x414347).to_rgb()
 
+# An image together with the coordinates at which it is to be composited onto a map image
+Layer: TypeAlias = tuple[Image.Image, tuple[int, int]]
+
+T = TypeVar("T")
+
+TIMING_BUCKETS_MS = (0.1, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, math.inf)
+
+# Counts durations in fixed buckets, like a Prometheus histogram
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(TIMING_BUCKETS_MS)
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, duration_ms: float):
+        for i, le in enumerate(TIMING_BUCKETS_MS):
+            if duration_ms <= le:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum_ms += duration_ms
+
+    def merge(self, counts: Sequence[int], count: int, sum_ms: float):
+        for i, bucket_count in enumerate(counts):
+            self.counts[i] += bucket_count
+        self.count += count
+        self.sum_ms += sum_ms
+
+    def to_dict(self):
+        buckets: dict[str, int] = {}
+        total = 0
+        for le, count in zip(TIMING_BUCKETS_MS, self.counts):
+            total += count
+            buckets["+Inf" if le == math.inf else str(le)] = total
+        return {"count": self.count, "sum_ms": self.sum_ms, "buckets": buckets}
+
+STAGE_TIMINGS: dict[str, Histogram] = {}
+CACHE_COUNTS: dict[str, list[int]] = {}
+TIMINGS_LOCK = threading.Lock()
+_TRACE = threading.local()
+
+def timings_enabled():
+    return get_config().images.timings
+
+def _is_tracing() -> bool:
+    return getattr(_TRACE, "stages", None) is not None
+
+class _TimedStage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        duration_ms = (time.perf_counter() - self.start) * 1000
+        if timings_enabled():
+            with TIMINGS_LOCK:
+                hist = STAGE_TIMINGS.get(self.name)
+                if hist is None:
+                    hist = STAGE_TIMINGS[self.name] = Histogram()
+                hist.observe(duration_ms)
+        stages = getattr(_TRACE, "stages", None)
+        if stages is not None:
+            stages.append((self.name, duration_ms))
+
+_NOT_TIMED = contextlib.nullcontext()
+
+# Time a stage of the render pipeline
+def timed_stage(name: str):
+    if timings_enabled() or _is_tracing():
+        return _TimedStage(name)
+    return _NOT_TIMED
+
+def record_cache_lookup(name: str, hit: bool):
+    if timings_enabled():
+        with TIMINGS_LOCK:
+            counts = CACHE_COUNTS.setdefault(name, [0, 0])
+            counts[0 if hit else 1] += 1
+    stages = getattr(_TRACE, "stages", None)
+    if stages is not None:
+        stages.append((f"{name}_{'hit' if hit else 'miss'}", None))
+
+# Log every stage of a render as a single line when debug logging is enabled
+@contextlib.contextmanager
+def render_trace(name: str):
+    if _is_tracing() or not logging.getLogger().isEnabledFor(logging.DEBUG):
+        yield
+        return
+
+    stages: list[tuple[str, float | None]] = []
+    _TRACE.stages = stages
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _TRACE.stages = None
+        logging.debug(
+            "Rendered %s in %.1fms: %s",
+            name,
+            (time.perf_counter() - start) * 1000,
+            ", ".join(
+                stage if duration_ms is None else f"{stage}={duration_ms:.1f}ms"
+                for stage, duration_ms in stages
+            ) or "no stages",
+        )
+
+def pop_render_timings():
+    # Taken by worker processes, to hand them to the main process
+    with TIMINGS_LOCK:
+        timings = (
+            {name: (hist.counts, hist.count, hist.sum_ms) for name, hist in STAGE_TIMINGS.items()},
+            {name: (hits, misses) for name, (hits, misses) in CACHE_COUNTS.items()},
+        )
+        STAGE_TIMINGS.clear()
+        CACHE_COUNTS.clear()
+    return timings
+
+def merge_render_timings(timings: tuple[dict[str, tuple[list[int], int, float]], dict[str, tuple[int, int]]]):
+    stages, caches = timings
+    with TIMINGS_LOCK:
+        for name, (counts, count, sum_ms) in stages.items():
+            hist = STAGE_TIMINGS.get(name)
+            if hist is None:
+                hist = STAGE_TIMINGS[name] = Histogram()
+            hist.merge(counts, count, sum_ms)
+        for name, (hits, misses) in caches.items():
+            cache_counts = CACHE_COUNTS.setdefault(name, [0, 0])
+            cache_counts[0] += hits
+            cache_counts[1] += misses
+
+# Get the timings of every stage of the render pipeline, and the hit rates of its caches
+def get_render_timings():
+    with TIMINGS_LOCK:
+        return {
+            "stages": {name: hist.to_dict() for name, hist in STAGE_TIMINGS.items()},
+            "caches": {
+                name: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+                for name, (hits, misses) in CACHE_COUNTS.items()
+            },
+        }
+
+LAYER_CACHE_LOCK = threading.Lock()
+
+@cached(cache={}, lock=LAYER_CACHE_LOCK)
+def get_font(size: float):
+    with timed_stage("font"):
+        return ImageFont.truetype(ARIAL_BOLD_TTF, size=size)
+
 def open_tacmap(details: MapDetails):
-    im = Image.open(details.tacmap)
-    return im
+    return open_asset(details.tacmap)
 
 def open_faction(faction: Faction, selected: bool = False):
     if selected:
         path = faction.images.selected
     else:
         path = faction.images.default
-    im = Image.open(path)
-    return im
+    return open_asset(path)
 
 def open_environment(environment: Environment):
-    im = Image.open(environment.image)
-    return im
+    return open_asset(environment.image)
 
-def draw_layout(im: Image.Image, layout: LayoutType, orientation: Orientation):
+def get_tacmap_asset_name(details: MapDetails, size: int = IM_SIZE):
+    return f"tacmap/{details.key}/{size}"
+
+def get_faction_asset_name(faction: Faction, selected: bool = False, size: int = IM_SIZE):
+    return f"faction/{faction.key}/{'selected' if selected else 'default'}/{size}"
+
+def get_environment_asset_name(environment: Environment, size: int = IM_SIZE):
+    return f"environment/{environment.key}/{size}"
+
+def get_layout_asset_name(layout: LayoutType, orientation: Orientation, size: int = IM_SIZE):
+    return f"layout/{orientation.value}/{''.join(str(i) for i in layout)}/{size}"
+
+# A hash of everything the baked assets are made from, to reject outdated asset packs
+def get_assets_digest():
+    h = hashlib.sha256()
+    h.update(repr((RENDER_VERSION, IM_SIZE, THUMBNAIL_SIZE, LAYOUT_COMBINATIONS)).encode())
+    for details in MAPS.values():
+        h.update(details.model_dump_json().encode())
+    for path in (ARIAL_BOLD_TTF, *get_asset_paths()):
+        h.update(hash_file(path).encode())
+    return h.hexdigest()
+
+_ASSET_PACK: AssetPack | None = None
+_ASSET_PACK_LOADED = False
+_ASSET_PACK_LOCK = threading.Lock()
+def get_asset_pack() -> AssetPack | None:
+    global _ASSET_PACK, _ASSET_PACK_LOADED
+    if _ASSET_PACK_LOADED:
+        return _ASSET_PACK
+
+    with _ASSET_PACK_LOCK:
+        if _ASSET_PACK_LOADED:
+            return _ASSET_PACK
+
+        path = get_config().images.asset_pack
+        if path and path.exists():
+            try:
+                pack = AssetPack(path)
+            except (OSError, ValueError):
+                logging.warning("Failed to load asset pack %s", path, exc_info=True)
+            else:
+                if pack.digest == get_assets_digest():
+                    _ASSET_PACK = pack
+                    logging.info("Loaded asset pack %s with %s assets", path, len(pack))
+                else:
+                    logging.warning(
+                        "Asset pack %s is outdated and will not be used, run `python -m scripts.bake_assets` to update it",
+                        path,
+                    )
+
+        _ASSET_PACK_LOADED = True
+        return _ASSET_PACK
+
+def load_assets():
+    # Assets only need to be decoded when there is no asset pack to read them from
+    if get_asset_pack() is None and not get_config().images.lazy_assets:
+        get_asset_store()
+
+def get_packed_asset(name: str) -> Layer | None:
+    pack = get_asset_pack()
+    if pack is not None:
+        return pack.get(name)
+    return None
+
+@cached(
+    cache=LRUCache(maxsize=32),
+    key=lambda faction, selected=False, size=IM_SIZE: hashkey(faction.key, selected, size),
+    lock=LAYER_CACHE_LOCK,
+)
+def get_faction_icon(faction: Faction, selected: bool = False, size: int = IM_SIZE):
+    packed = get_packed_asset(get_faction_asset_name(faction, selected, size))
+    if packed:
+        return packed[0]
+
+    f_size = int(size / 4)
+    with timed_stage("faction_resize"):
+        return open_faction(faction, selected=selected).resize(
+            (f_size, f_size),
+            resample=Image.Resampling.BICUBIC,
+        )
+
+@cached(
+    cache=LRUCache(maxsize=32),
+    key=lambda environment, size=IM_SIZE: hashkey(environment.key, size),
+    lock=LAYER_CACHE_LOCK,
+)
+def get_environment_icon(environment: Environment, size: int = IM_SIZE):
+    packed = get_packed_asset(get_environment_asset_name(environment, size))
+    if packed:
+        return packed[0]
+
+    im_size = int(size / 5)
+    with timed_stage("environment_resize"):
+        return open_environment(environment).resize(
+            (im_size, im_size),
+            resample=Image.Resampling.BICUBIC,
+        )
+
+def draw_layout(im: Image.Image, layout: LayoutType, orientation: Orientation, size: int = IM_SIZE):
     draw = ImageDraw.Draw(im)
     do_flip = orientation == Orientation.VERTICAL
+    thickness = max(1, int(OBJECTIVE_LINE_THICKNESS * size / IM_SIZE))
 
     def get_y(p: int):
         return (p + 1.5) * line_width * 2
 
-    line_width = IM_SIZE / (5 * 2)
+    line_width = size / (5 * 2)
     x = x_old = line_width / -2
     y = y_old = get_y(layout[0])
     
@@ -60,13 +334,13 @@ def draw_layout(im: Image.Image, layout: LayoutType, orientation: Orientation):
         y = get_y(p)
         draw.circle(
             (y, x) if do_flip else (x, y),
-            radius=(OBJECTIVE_LINE_THICKNESS / 2) - 1,
+            radius=(thickness / 2) - 1,
             fill=Colors.OBJECTIVE_LINE.value
         )
         draw.line(
             (y_old, x_old, y, x) if do_flip else (x_old, y_old, x, y),
             fill=Colors.OBJECTIVE_LINE.value,
-            width=OBJECTIVE_LINE_THICKNESS
+            width=thickness
         )
         
         x_old = x
@@ -74,19 +348,19 @@ def draw_layout(im: Image.Image, layout: LayoutType, orientation: Orientation):
         x += line_width
         draw.circle(
             (y, x) if do_flip else (x, y),
-            radius=(OBJECTIVE_LINE_THICKNESS / 2) - 1,
+            radius=(thickness / 2) - 1,
             fill=Colors.OBJECTIVE_LINE.value
         )
         draw.line(
             (y_old, x_old, y, x) if do_flip else (x_old, y_old, x, y),
             fill=Colors.OBJECTIVE_LINE.value,
-            width=OBJECTIVE_LINE_THICKNESS
+            width=thickness
         )
 
         # Draw strongpoints
         # draw.circle(
         #     (y, x-(line_width/2)) if do_flip else (x-(line_width/2), y),
-        #     radius=(OBJECTIVE_LINE_THICKNESS / 2) + 10,
+        #     radius=(thickness / 2) + 10,
         #     fill=Colors.OBJECTIVE_LINE.value,
         # )
     
@@ -96,17 +370,12 @@ def draw_factions(
     im: Image.Image,
     details: MapDetails,
     selected_team_id: Literal[1] | Literal[2] | None = None,
-    spaced: bool = False
+    spaced: bool = False,
+    size: int = IM_SIZE,
 ):
-    f_size = int(IM_SIZE / 4)
-    im_allies = open_faction(details.allies, selected=(selected_team_id == 1)).resize(
-        (f_size, f_size),
-        resample=Image.Resampling.BICUBIC,
-    )
-    im_axis = open_faction(details.axis, selected=(selected_team_id == 2)).resize(
-        (f_size, f_size),
-        resample=Image.Resampling.BICUBIC,
-    )
+    f_size = int(size / 4)
+    im_allies = get_faction_icon(details.allies, selected=(selected_team_id == 1), size=size)
+    im_axis = get_faction_icon(details.axis, selected=(selected_team_id == 2), size=size)
 
     ims = [im_allies, im_axis]
     if details.flip_sides:
@@ -115,50 +384,46 @@ def draw_factions(
     if details.orientation == Orientation.HORIZONTAL:
         im_allies_coords = (
             0,
-            IM_SIZE - f_size,
+            size - f_size,
         )
         im_axis_coords = (
-            (IM_SIZE - f_size) if spaced else f_size,
-            IM_SIZE - f_size,
+            (size - f_size) if spaced else f_size,
+            size - f_size,
         )
     else:
         im_allies_coords = (
-            IM_SIZE - f_size,
+            size - f_size,
             0,
         )
         im_axis_coords = (
-            IM_SIZE - f_size,
-            (IM_SIZE - f_size) if spaced else f_size,
+            size - f_size,
+            (size - f_size) if spaced else f_size,
         )
 
-    im.paste(ims[0], im_allies_coords, mask=ims[0])
-    im.paste(ims[1], im_axis_coords, mask=ims[1])
+    im.alpha_composite(ims[0], im_allies_coords)
+    im.alpha_composite(ims[1], im_axis_coords)
 
     return im
 
-def draw_environment(im: Image.Image, environment: Environment):
-    im_size = int(IM_SIZE / 5)
-    im_environment = open_environment(environment).resize(
-        (im_size, im_size),
-        resample=Image.Resampling.BICUBIC,
-    )
-    im.paste(
+def draw_environment(im: Image.Image, environment: Environment, size: int = IM_SIZE):
+    im_size = int(size / 5)
+    im_environment = get_environment_icon(environment, size=size)
+    im.alpha_composite(
         im_environment,
         (im_size * 4, im_size * 4),
-        mask=im_environment,
     )
     return im
 
-def draw_map_name(im: Image.Image, name: str, orientation: Orientation):
-    canvas = Image.new(mode="RGBA", size=(IM_SIZE, IM_SIZE // 5))
+def draw_map_name(im: Image.Image, name: str, orientation: Orientation, size: int = IM_SIZE):
+    canvas = Image.new(mode="RGBA", size=(size, size // 5))
     draw = ImageDraw.Draw(canvas)
 
-    font = ImageFont.truetype(ARIAL_BOLD_TTF, size=57 / 400 * IM_SIZE)
+    font = get_font(57 / 400 * size)
     dx0, dy0, dx1, dy1 = draw.textbbox((0, 0), text=name, font=font)
     draw.text(
         (
-            (IM_SIZE - dx0 - dx1) / 2,
-            (IM_SIZE / 5 - dy0 - dy1) / 2,
+            (size - dx0 - dx1) / 2,
+            (size / 5 - dy0 - dy1) / 2,
         ),
         text=name,
         fill="white",
@@ -170,25 +435,84 @@ def draw_map_name(im: Image.Image, name: str, orientation: Orientation):
     
     im.paste(canvas, mask=canvas)
 
+# Crop an overlay to its contents, so that compositing it touches fewer pixels
+def to_layer(im: Image.Image) -> Layer:
+    bbox = im.getbbox()
+    if not bbox:
+        return im.crop((0, 0, 1, 1)), (0, 0)
+    return im.crop(bbox), (bbox[0], bbox[1])
+
+@cached(
+    cache=LRUCache(maxsize=32),
+    key=lambda details, size=IM_SIZE: hashkey(details.key, size),
+    lock=LAYER_CACHE_LOCK,
+)
+def get_tacmap_layer(details: MapDetails, size: int = IM_SIZE):
+    packed = get_packed_asset(get_tacmap_asset_name(details, size))
+    if packed:
+        return packed[0]
+
+    with timed_stage("tacmap"):
+        im = open_tacmap(details).convert("RGBA")
+        if im.size != (size, size):
+            im = im.resize((size, size), resample=Image.Resampling.LANCZOS)
+    with timed_stage("map_name"):
+        draw_map_name(im, details.short_name, details.orientation, size=size)
+    return im
 
-@cached(LRUCache(10))
-def get_placeholder(num: int = 1):
-    im = Image.new(mode="RGBA", size=(IM_SIZE, IM_SIZE))
+@cached(
+    cache=LRUCache(maxsize=128),
+    key=lambda details, selected_team_id, size=IM_SIZE: hashkey(details.key, selected_team_id, size),
+    lock=LAYER_CACHE_LOCK,
+)
+def get_factions_layer(details: MapDetails, selected_team_id: Literal[1, 2] | None, size: int = IM_SIZE) -> Layer:
+    im = Image.new(mode="RGBA", size=(size, size))
+    draw_factions(im, details, selected_team_id=selected_team_id, size=size)
+    return to_layer(im)
+
+@cached(cache=LRUCache(maxsize=64), lock=LAYER_CACHE_LOCK)
+def get_layout_layer(layout: LayoutType, orientation: Orientation, size: int = IM_SIZE) -> Layer:
+    packed = get_packed_asset(get_layout_asset_name(layout, orientation, size))
+    if packed:
+        return packed
+
+    with timed_stage("layout_draw"):
+        im = Image.new(mode="RGBA", size=(size, size))
+        draw_layout(im, layout, orientation, size=size)
+        return to_layer(im)
+
+@cached(
+    cache=LRUCache(maxsize=32),
+    key=lambda environment, size=IM_SIZE: hashkey(environment.key, size),
+    lock=LAYER_CACHE_LOCK,
+)
+def get_environment_layer(environment: Environment, size: int = IM_SIZE) -> Layer:
+    im = Image.new(mode="RGBA", size=(size, size))
+    draw_environment(im, environment, size=size)
+    return to_layer(im)
+
+
+@cached(LRUCache(32), lock=LAYER_CACHE_LOCK)
+def get_placeholder(num: int = 1, grayscaled: bool = False, size: int = IM_SIZE):
+    if grayscaled:
+        return get_grayscale(get_placeholder(num, size=size))
+
+    im = Image.new(mode="RGBA", size=(size, size))
     draw = ImageDraw.Draw(im)
     draw.rounded_rectangle(
-        (0, 0, IM_SIZE, IM_SIZE),
-        radius=60,
+        (0, 0, size, size),
+        radius=int(PLACEHOLDER_ROUND_RADIUS * size / IM_SIZE),
         fill=Colors.PLACEHOLDER_BG.value,
     )
 
     if num > 1:
         text = f"+{num}"
-        font = ImageFont.truetype(ARIAL_BOLD_TTF, size=0.5 * IM_SIZE)
+        font = get_font(0.5 * size)
         dx0, dy0, dx1, dy1 = draw.textbbox((0, 0), text=text, font=font)
         draw.text(
             (
-                (IM_SIZE - dx0 - dx1) / 2 - (0.02 * IM_SIZE),
-                (IM_SIZE - dy0 - dy1) / 2,
+                (size - dx0 - dx1) / 2 - (0.02 * size),
+                (size - dy0 - dy1) / 2,
             ),
             text=text,
             fill=Colors.PLACEHOLDER_TEXT.value,
@@ -197,36 +521,391 @@ def get_placeholder(num: int = 1):
 
     return im
 
-@cached(cache=LRUCache(maxsize=100))
+# A size-capped cache of rendered map images on disk
+class TileDiskCache:
+    def __init__(self, path: Path, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.total_size = 0
+        self._files: OrderedDict[str, int] | None = None
+
+    def _get_files(self):
+        if self._files is None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            entries = [
+                (entry.stat().st_mtime, entry.name, entry.stat().st_size)
+                for entry in os.scandir(self.path)
+                if entry.is_file() and entry.name.endswith(".png")
+            ]
+            self._files = OrderedDict(
+                (name, size) for _, name, size in sorted(entries)
+            )
+            self.total_size = sum(self._files.values())
+        return self._files
+
+    def get(self, digest: str) -> Image.Image | None:
+        fn = f"{digest}.png"
+        fp = self.path / fn
+        with self.lock:
+            files = self._get_files()
+            if fn in files:
+                files.move_to_end(fn)
+            elif not fp.exists():
+                return None
+
+        try:
+            with timed_stage("disk_read"):
+                im = Image.open(fp)
+                im.load()
+            os.utime(fp)
+        except FileNotFoundError:
+            # Evicted by another process
+            self._forget(fn)
+            return None
+        except OSError:
+            logging.warning("Failed to read cached image %s", fp, exc_info=True)
+            self._forget(fn)
+            return None
+
+        with self.lock:
+            files = self._get_files()
+            if fn not in files:
+                # Written by another process
+                size = os.path.getsize(fp) if fp.exists() else 0
+                files[fn] = size
+                self.total_size += size
+        return im
+
+    def contains(self, digest: str):
+        fn = f"{digest}.png"
+        with self.lock:
+            return fn in self._get_files() or (self.path / fn).exists()
+
+    def put(self, digest: str, im: Image.Image):
+        fn = f"{digest}.png"
+        fp = self.path / fn
+        tmp_fp = self.path / f"{fn}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            im.save(tmp_fp, "png", compress_level=1)
+            os.replace(tmp_fp, fp)
+            size = fp.stat().st_size
+        except OSError:
+            logging.warning("Failed to write cached image %s", fp, exc_info=True)
+            tmp_fp.unlink(missing_ok=True)
+            return
+
+        with self.lock:
+            files = self._get_files()
+            self.total_size += size - files.pop(fn, 0)
+            files[fn] = size
+            self._evict()
+
+    def _forget(self, fn: str):
+        with self.lock:
+            files = self._get_files()
+            self.total_size -= files.pop(fn, 0)
+
+    def _evict(self):
+        if self.total_size <= self.max_size:
+            return
+
+        # Other processes may have added or removed files in the meantime.
+        # Evicting down to below the limit means that this scan is not
+        # repeated for every image written.
+        self._files = None
+        files = self._get_files()
+        target_size = int(self.max_size * 0.9)
+        while self.total_size > target_size and files:
+            fn, size = files.popitem(last=False)
+            self.total_size -= size
+            try:
+                (self.path / fn).unlink(missing_ok=True)
+            except OSError:
+                logging.warning("Failed to evict cached image %s", fn, exc_info=True)
+
+_DISK_CACHE: TileDiskCache | None = None
+def get_disk_cache() -> TileDiskCache | None:
+    global _DISK_CACHE
+    if not _DISK_CACHE:
+        config = get_config().images
+        if not config.cache_dir or not config.cache_max_size_mb:
+            return None
+        _DISK_CACHE = TileDiskCache(config.cache_dir, config.cache_max_size_mb * 1024 * 1024)
+    return _DISK_CACHE
+
+@cached(cache={})
+def hash_file(path: Path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+def get_map_image_digest(
+    details: MapDetails,
+    layout: LayoutType | None,
+    environment: Environment | None,
+    selected_team_id: Literal[1, 2] | None,
+    size: int = IM_SIZE,
+):
+    paths = [
+        ARIAL_BOLD_TTF,
+        details.tacmap,
+        details.allies.images.default,
+        details.allies.images.selected,
+        details.axis.images.default,
+        details.axis.images.selected,
+    ]
+    if environment:
+        paths.append(environment.image)
+
+    h = hashlib.sha256()
+    h.update(repr((RENDER_VERSION, size, layout, selected_team_id)).encode())
+    h.update(details.model_dump_json().encode())
+    if environment:
+        h.update(environment.model_dump_json().encode())
+    for path in paths:
+        h.update(hash_file(path).encode())
+    return h.hexdigest()
+
+# A small description of a map image: its map key, layout, environment key and selected team
+TileKey: TypeAlias = tuple[str, LayoutType | None, str | None, Literal[1, 2] | None]
+
+TILE_KEYS: dict[TileKey, TileKey] = {}
+TILE_KEYS_LOCK = threading.Lock()
+
+# Get the one shared instance of a tile key
+def intern_tile_key(key: TileKey) -> TileKey:
+    try:
+        return TILE_KEYS[key]
+    except KeyError:
+        map_key, layout, environment_key, selected_team_id = key
+        interned = (
+            sys.intern(map_key),
+            tuple(layout) if layout else None,
+            sys.intern(environment_key) if environment_key else None,
+            selected_team_id,
+        )
+        with TILE_KEYS_LOCK:
+            return TILE_KEYS.setdefault(interned, interned) # type: ignore
+
+def get_tile_key(
+    details: MapDetails,
+    layout: LayoutType | None,
+    environment: Environment | None,
+    selected_team_id: Literal[1, 2] | None
+) -> TileKey:
+    return intern_tile_key((details.key, layout, environment.key if environment else None, selected_team_id))
+
+def offer_to_tile_key(offer: 'Offer', flip_sides: bool = False) -> TileKey:
+    return intern_tile_key((
+        offer.map,
+        offer.layout,
+        offer.environment,
+        (1 if flip_sides == bool(offer.offer_no % 2) else 2) if offer.accepted else None,
+    ))
+
+def get_image_nbytes(im: Image.Image):
+    return im.width * im.height * len(im.getbands())
+
+# The tile key, size and whether the image is grayscaled
+MapImageKey: TypeAlias = tuple[TileKey, int, bool]
+
+MAP_IMAGE_CACHE: LRUCache[MapImageKey, Image.Image] = LRUCache(
+    maxsize=get_config().images.map_image_cache_size_mb * 1024 * 1024,
+    getsizeof=get_image_nbytes,
+)
+MAP_IMAGE_CACHE_LOCK = threading.Lock()
+
+def set_cached_map_image(key: MapImageKey, im: Image.Image):
+    with MAP_IMAGE_CACHE_LOCK:
+        try:
+            MAP_IMAGE_CACHE[key] = im
+        except ValueError:
+            pass  # value too large
+
+# Map images in shared memory, used by all render processes
+_SHARED_TILE_CACHE: SharedTileCache | None = None
+SHARED_TILE_SLOT_SIZE = IM_SIZE * IM_SIZE * 4
+
+def get_shared_tile_cache():
+    return _SHARED_TILE_CACHE
+
+def create_shared_tile_cache(max_workers: int):
+    global _SHARED_TILE_CACHE
+    size = get_config().images.shared_cache_size_mb * 1024 * 1024
+    if size >= SHARED_TILE_SLOT_SIZE and not _SHARED_TILE_CACHE:
+        _SHARED_TILE_CACHE = SharedTileCache.create(
+            num_slots=size // SHARED_TILE_SLOT_SIZE,
+            slot_size=SHARED_TILE_SLOT_SIZE,
+            # The workers and this process
+            max_processes=max_workers + 1,
+        )
+        logging.info(
+            "Created a shared tile cache of %s slots (%.1f MB)",
+            _SHARED_TILE_CACHE.num_slots,
+            _SHARED_TILE_CACHE.nbytes / 1024 / 1024,
+        )
+    return _SHARED_TILE_CACHE
+
+def close_shared_tile_cache():
+    global _SHARED_TILE_CACHE
+    if _SHARED_TILE_CACHE:
+        _SHARED_TILE_CACHE.close()
+        _SHARED_TILE_CACHE = None
+
+def attach_shared_tile_cache(handle: tuple[str, Any] | None):
+    global _SHARED_TILE_CACHE
+    if handle:
+        _SHARED_TILE_CACHE = SharedTileCache.attach(*handle)
+
+def init_render_worker(shared_cache_handle: tuple[str, Any] | None):
+    attach_shared_tile_cache(shared_cache_handle)
+    load_assets()
+
+def get_shared_tile_key(key: MapImageKey) -> bytes:
+    return hashlib.sha256(repr(key).encode()).digest()[:SLOT_KEY_SIZE]
+
+# Get a map image, looking in memory first, then on disk, and only rendering it if neither has it
 def get_map_image(
+    details: MapDetails,
+    layout: LayoutType | None,
+    environment: Environment | None,
+    selected_team_id: Literal[1, 2] | None,
+    grayscaled: bool = False,
+    size: int = IM_SIZE,
+):
+    tile_key = get_tile_key(details, layout, environment, selected_team_id)
+    key: MapImageKey = (tile_key, size, grayscaled)
+    with MAP_IMAGE_CACHE_LOCK:
+        im = MAP_IMAGE_CACHE.get(key)
+    record_cache_lookup("map_image", im is not None)
+    if im is not None:
+        return im
+
+    shared_cache = get_shared_tile_cache()
+    shared_key = get_shared_tile_key(key) if shared_cache else None
+    if shared_cache and shared_key:
+        im = shared_cache.get(shared_key)
+        record_cache_lookup("shared", im is not None)
+        if im is not None:
+            return im
+
+    if grayscaled:
+        im = get_grayscale(get_map_image(details, layout, environment, selected_team_id, size=size))
+    else:
+        disk_cache = get_disk_cache()
+        if disk_cache:
+            digest = get_map_image_digest(details, layout, environment, selected_team_id, size)
+            im = disk_cache.get(digest)
+            record_cache_lookup("disk", im is not None)
+            if im is None:
+                im = render_map_image(details, layout, environment, selected_team_id, size)
+                with timed_stage("disk_write"):
+                    disk_cache.put(digest, im)
+        else:
+            im = render_map_image(details, layout, environment, selected_team_id, size)
+
+    if shared_cache and shared_key and shared_cache.put(shared_key, im) is not None:
+        return im
+
+    set_cached_map_image(key, im)
+    return im
+
+# Cache a map image on disk without claiming a spot in the in-memory cache
+def prerender_map_image(
     details: MapDetails,
     layout: LayoutType | None,
     environment: Environment | None,
     selected_team_id: Literal[1, 2] | None
 ):
-    im = open_tacmap(details)
-    draw_factions(im, details, selected_team_id=selected_team_id)
-    draw_map_name(im, details.short_name, details.orientation)
+    disk_cache = get_disk_cache()
+    if not disk_cache:
+        get_map_image(details, layout, environment, selected_team_id)
+        return
 
-    if layout:
-        draw_layout(im, layout, details.orientation)
+    digest = get_map_image_digest(details, layout, environment, selected_team_id)
+    if not disk_cache.contains(digest):
+        im = render_map_image(details, layout, environment, selected_team_id)
+        disk_cache.put(digest, im)
 
+def iter_map_image_params(maps: Iterable[MapDetails]):
+    selected_team_id: Literal[1, 2] | None
+    for details in maps:
+        for environment in details.environments:
+            for layout in (None, *LAYOUT_COMBINATIONS):
+                for selected_team_id in (None, 1, 2):
+                    yield details, layout, environment, selected_team_id
+
+def _lower_thread_priority():
+    # On Linux, niceness is tracked per thread, so this only affects the
+    # warm-up thread and leaves the rest of the bot alone.
+    if sys.platform == "linux":
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except OSError:
+            pass
+
+# Render every possible map image in the background, before it is first needed
+async def warm_up_map_images(map_keys: Sequence[str] | None = None):
+    if map_keys:
+        maps = [MAPS[key] for key in map_keys]
+    else:
+        maps = list(MAPS.values())
+
+    all_params = list(iter_map_image_params(maps))
+    total = len(all_params)
+    logging.info("Warming up %s map images for %s maps", total, len(maps))
+
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+    log_interval = max(1, total // 10)
+    with ThreadPoolExecutor(
+        max_workers=1,
+        thread_name_prefix="warm_up",
+        initializer=_lower_thread_priority,
+    ) as pool:
+        for i, params in enumerate(all_params, 1):
+            await loop.run_in_executor(pool, prerender_map_image, *params)
+            if i % log_interval == 0 or i == total:
+                logging.info("Warmed up %s/%s map images (%.1fs)", i, total, time.monotonic() - start)
+
+    logging.info("Finished warming up %s map images in %.1fs", total, time.monotonic() - start)
+
+def render_map_image(
+    details: MapDetails,
+    layout: LayoutType | None,
+    environment: Environment | None,
+    selected_team_id: Literal[1, 2] | None,
+    size: int = IM_SIZE,
+):
+    # Every layer is only drawn once, after which map images are put together
+    # by compositing the cached layers onto a copy of the tacmap.
+    layers = [get_factions_layer(details, selected_team_id, size)]
+    if layout:
+        layers.append(get_layout_layer(layout, details.orientation, size))
     if environment:
-        draw_environment(im, environment)
+        layers.append(get_environment_layer(environment, size))
 
+    with timed_stage("composite"):
+        im = get_tacmap_layer(details, size).copy()
+        for layer, dest in layers:
+            im.alpha_composite(layer, dest)
     return im
 
-def stack_in_rows(ims: Sequence[Image.Image], maxsize: int = 6, rowsize: int = 3, grayscaled: bool = False):
-    if len(ims) > maxsize:
-        raise ValueError("Amount of images exceeds max size")
-    
-    num_ims = len(ims) + 1
-    num_ims += ((rowsize - num_ims) % rowsize)
-    num_ims = min(num_ims, maxsize)
-        
+# Enough slots to fit one more image, rounded up to a full row
+def get_num_slots(num_ims: int, maxsize: int, rowsize: int = 3):
+    num_slots = num_ims + 1
+    num_slots += ((rowsize - num_slots) % rowsize)
+    return min(num_slots, maxsize)
+
+def get_slot_coords(i: int, rowsize: int = 3):
     dist = IM_SIZE + IM_STACK_GAP_SIZE
-    
-    num_rows = math.ceil(num_ims / rowsize)
+    return ((i % rowsize) * dist, (i // rowsize) * dist)
+
+# An offer sheet with only placeholders. Do not modify it, make a copy instead
+@cached(LRUCache(32), lock=LAYER_CACHE_LOCK)
+def get_empty_board(maxsize: int, rowsize: int, num_slots: int, grayscaled: bool = False):
+    dist = IM_SIZE + IM_STACK_GAP_SIZE
+    num_rows = math.ceil(num_slots / rowsize)
     canvas = Image.new(
         mode="RGBA",
         size=(
@@ -235,96 +914,674 @@ def stack_in_rows(ims: Sequence[Image.Image], maxsize: int = 6, rowsize: int = 3
         ),
     )
 
-    placeholder = get_placeholder()
-
-    row = 0
-    col = -1
-    for i in range(num_ims):
-        if i < len(ims):
-            im = ims[i]
-            if grayscaled:
-                im = get_grayscale(im)
-        elif i + 1 == num_ims:
-            num = 1 + maxsize - num_ims
-            im = get_placeholder(num=num)
+    placeholder = get_placeholder(grayscaled=grayscaled)
+    for i in range(num_slots):
+        if i + 1 == num_slots:
+            num = 1 + maxsize - num_slots
+            im = get_placeholder(num=num, grayscaled=grayscaled)
         else:
             im = placeholder
+        canvas.paste(im, get_slot_coords(i, rowsize))
 
-        col += 1
-        if col >= rowsize:
-            row += 1
-            col = 0
-        
-        canvas.paste(im, (col*dist, row*dist))
+    return canvas
+
+# Combine images into rows, padded with placeholders
+def stack_in_rows(ims: Sequence[Image.Image], maxsize: int = 6, rowsize: int = 3, grayscaled: bool = False):
+    if len(ims) > maxsize:
+        raise ValueError("Amount of images exceeds max size")
+
+    num_slots = get_num_slots(len(ims), maxsize, rowsize)
+    with timed_stage("stack"):
+        canvas = get_empty_board(maxsize, rowsize, num_slots, grayscaled).copy()
+        for i, im in enumerate(ims):
+            canvas.paste(im, get_slot_coords(i, rowsize))
 
     return canvas
 
+# Same as `stack_in_rows`, but desaturates the whole sheet at once with NumPy
+def stack_in_rows_numpy(ims: Sequence[Image.Image], maxsize: int = 6, rowsize: int = 3, grayscaled: bool = False):
+    if np is None:
+        raise RuntimeError("NumPy is not installed")
+    if len(ims) > maxsize:
+        raise ValueError("Amount of images exceeds max size")
+
+    with timed_stage("stack"):
+        return _stack_in_rows_numpy(ims, maxsize, rowsize, grayscaled)
+
+def _stack_in_rows_numpy(ims: Sequence[Image.Image], maxsize: int, rowsize: int, grayscaled: bool):
+    assert np is not None
+    num_slots = get_num_slots(len(ims), maxsize, rowsize)
+    sheet = np.array(get_empty_board(maxsize, rowsize, num_slots), dtype=np.uint8)
+    for i, im in enumerate(ims):
+        x, y = get_slot_coords(i, rowsize)
+        sheet[y:y+im.height, x:x+im.width] = np.asarray(im.convert("RGBA"))
+
+    if grayscaled:
+        # Matches ImageEnhance.Color(im).enhance(0.2): blend each pixel with
+        # its luminance, using the same integer weights as Pillow.
+        r, g, b = (sheet[..., i].astype(np.uint32) for i in range(3))
+        lum = ((r * 19595 + g * 38470 + b * 7471 + 0x8000) >> 16).astype(np.float32)[..., np.newaxis]
+        rgb = sheet[..., :3].astype(np.float32)
+        rgb -= lum
+        rgb *= np.float32(0.2)
+        rgb += lum
+        sheet[..., :3] = rgb
+
+    return Image.fromarray(sheet, mode="RGBA")
+
+def use_numpy():
+    return np is not None and get_config().images.use_numpy
+
+def _encode_image(im: Image.Image, encoding: ImageEncoding):
+    fp = BytesIO()
+    if encoding.format == "webp":
+        im.save(
+            fp, "webp",
+            quality=encoding.quality,
+            lossless=encoding.lossless,
+            method=min(encoding.compress_level, 6),
+        )
+    else:
+        if encoding.quantize:
+            im = im.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+        im.save(fp, "png", compress_level=encoding.compress_level)
+    return fp.getvalue()
+
+# Encode an image following the given encoding profile, or the one from the config if none is given
+def encode_image(im: Image.Image, encoding: ImageEncoding | None = None) -> bytes:
+    if encoding is None:
+        encoding = get_config().images.encoding
+
+    with timed_stage("encode"):
+        data = _encode_image(im, encoding)
+        if encoding.max_size_kb:
+            max_size = encoding.max_size_kb * 1024
+            for _ in range(5):
+                if len(data) <= max_size:
+                    break
+                # Encoded size scales roughly with the amount of pixels
+                scale = math.sqrt(max_size / len(data)) * 0.95
+                im = im.resize(
+                    (max(1, int(im.width * scale)), max(1, int(im.height * scale))),
+                    resample=Image.Resampling.LANCZOS,
+                )
+                data = _encode_image(im, encoding)
+    return data
+
+def get_image_extension():
+    return get_config().images.encoding.format
+
+# An encoded image, together with a hash of its contents and the key it was rendered from
+class RenderedImage(NamedTuple):
+    data: bytes
+    digest: str
+
+    @classmethod
+    def create(cls, key: Hashable, data: bytes):
+        h = hashlib.sha256(repr(key).encode())
+        h.update(data)
+        return cls(data, h.hexdigest())
+
+    # Stays the same for as long as the image does
+    def get_file_name(self, name: str):
+        return f"{name}_{self.digest[:16]}.{get_image_extension()}"
+
+    def open(self):
+        # A BytesIO created from bytes shares its buffer, so this is not copied
+        return BytesIO(self.data)
+
 def get_grayscale(im: Image.Image):
     # im = im.convert("LA")
-    im = ImageEnhance.Color(im).enhance(0.2)
+    with timed_stage("grayscale"):
+        im = ImageEnhance.Color(im).enhance(0.2)
     return im
 
 
-def offers_to_image_sync(offers: Sequence['Offer'], max_num_offers: int, grayscaled: bool = False, flip_sides: bool = False):
-    # Process individual images inside of a thread pool
-    pool = ThreadPoolExecutor()
-    futs: list[Future] = []
-    for offer in offers:
-        fut = pool.submit(
-            get_map_image,
-            details=offer.get_map_details(),
-            layout=offer.layout,
-            environment=offer.get_environment(),
-            selected_team_id=(1 if flip_sides == bool(offer.offer_no % 2) else 2) if offer.accepted else None,
+def get_tile_image(key: TileKey, grayscaled: bool = False, size: int = IM_SIZE):
+    map_key, layout, environment_key, selected_team_id = key
+    return get_map_image(
+        details=MAPS[map_key],
+        layout=layout,
+        environment=ENVIRONMENTS[environment_key] if environment_key else None,
+        selected_team_id=selected_team_id,
+        grayscaled=grayscaled,
+        size=size,
+    )
+
+
+# Keeps track of how many jobs submitted to an executor are waiting and running
+class _RenderExecutorMixin:
+    def _init_stats(self, max_workers: int):
+        self.max_workers = max_workers
+        self._stats_lock = threading.Lock()
+        self.num_pending = 0
+        self.num_completed = 0
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._stats_lock:
+            self.num_pending += 1
+        fut = super().submit(fn, *args, **kwargs) # type: ignore
+        fut.add_done_callback(self._on_done)
+        return fut
+
+    def _on_done(self, fut: Future):
+        with self._stats_lock:
+            self.num_pending -= 1
+            self.num_completed += 1
+
+    def get_stats(self):
+        with self._stats_lock:
+            num_running = min(self.num_pending, self.max_workers)
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.num_pending - num_running,
+                "running": num_running,
+                "completed": self.num_completed,
+                "utilization": num_running / self.max_workers,
+                "saturation": self.num_pending / self.max_workers,
+            }
+
+# A bounded thread pool shared by all render entry points
+class RenderExecutor(_RenderExecutorMixin, ThreadPoolExecutor):
+    def __init__(self, max_workers: int):
+        super().__init__(max_workers=max_workers, thread_name_prefix="render")
+        self._init_stats(max_workers)
+
+def _run_in_worker(fn: Callable[..., T], *args: Any) -> tuple[T, Any, int, Any]:
+    result = fn(*args)
+    timings = pop_render_timings() if timings_enabled() else None
+    return result, timings, os.getpid(), get_asset_store_stats()
+
+# A bounded process pool shared by all render entry points
+class RenderProcessExecutor(_RenderExecutorMixin, ProcessPoolExecutor):
+    def __init__(self, max_workers: int):
+        shared_cache = create_shared_tile_cache(max_workers)
+        super().__init__(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_render_worker,
+            initargs=(shared_cache.get_handle() if shared_cache else None,),
         )
-        futs.append(fut)
+        self._init_stats(max_workers)
+        self.worker_assets: dict[int, Any] = {}
 
-    # Wait for all futures to complete, then close the pool to free resources
-    pool.shutdown(wait=True)
-    ims = [fut.result() for fut in futs]
+    def submit(self, fn, /, *args, **kwargs):
+        # Workers hand back what they recorded along with the result, which
+        # is merged into the stats of this process
+        job = super().submit(_run_in_worker, fn, *args, **kwargs)
+        fut: Future = Future()
+        fut.add_done_callback(lambda _: fut.cancelled() and job.cancel())
+        job.add_done_callback(functools.partial(self._on_worker_done, fut))
+        return fut
 
-    # Combine the individual images
-    im = stack_in_rows(ims, maxsize=max_num_offers, grayscaled=grayscaled)
+    def _on_worker_done(self, fut: Future, job: Future):
+        try:
+            if job.cancelled():
+                fut.cancel()
+            elif (exc := job.exception()) is not None:
+                fut.set_exception(exc)
+            else:
+                result, timings, pid, assets = job.result()
+                if timings:
+                    merge_render_timings(timings)
+                self.worker_assets[pid] = assets
+                fut.set_result(result)
+        except InvalidStateError:
+            pass  # cancelled in the meantime
 
-    fp = BytesIO()
-    im.save(fp, "png")
-    fp.seek(0)
-    return fp
+_RENDER_EXECUTOR: RenderExecutor | RenderProcessExecutor | None = None
+def get_render_executor() -> RenderExecutor | RenderProcessExecutor:
+    global _RENDER_EXECUTOR
+    if not _RENDER_EXECUTOR:
+        config = get_config().images
+        max_workers = config.render_workers or min(4, os.cpu_count() or 1)
+        if config.render_backend == "process":
+            _RENDER_EXECUTOR = RenderProcessExecutor(max_workers)
+        else:
+            _RENDER_EXECUTOR = RenderExecutor(max_workers)
+    return _RENDER_EXECUTOR
 
-async def offers_to_image(offers: Sequence['Offer'], max_num_offers: int, grayscaled: bool = False, flip_sides: bool = False):
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(
-        None, offers_to_image_sync, offers, max_num_offers, grayscaled, flip_sides
-    )
+# Replace a render executor that can no longer be used, such as a broken process pool
+def reset_render_executor(executor: RenderExecutor | RenderProcessExecutor):
+    global _RENDER_EXECUTOR
+    if _RENDER_EXECUTOR is executor:
+        logging.warning("Render executor is broken, starting a new one")
+        _RENDER_EXECUTOR = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        if isinstance(executor, RenderProcessExecutor):
+            # A worker that died may have held the lock of the shared tile
+            # cache, or pinned some of its slots, so its replacement starts
+            # with a new one
+            close_shared_tile_cache()
 
-def get_single_offer_image_sync(
-    details: MapDetails | None = None,
-    layout: LayoutType | None = None,
-    environment: Environment | None = None,
-    selected_team_id: Literal[1, 2] | None = None,
-):
-    if details:
-        im = get_map_image(
-            details=details,
-            layout=layout,
-            environment=environment,
-            selected_team_id=selected_team_id,
+def get_asset_stats():
+    pack = get_asset_pack()
+    executor = get_render_executor()
+    return {
+        "store": get_asset_store_stats(),
+        "worker_stores": executor.worker_assets if isinstance(executor, RenderProcessExecutor) else None,
+        "pack": {"assets": len(pack), "size_mb": pack.nbytes / 1024 / 1024} if pack is not None else None,
+    }
+
+def get_render_stats():
+    shared_cache = get_shared_tile_cache()
+    return {
+        **get_render_executor().get_stats(),
+        "priorities": get_render_scheduler().get_stats(),
+        "single_flight": RENDER_FLIGHTS.get_stats(),
+        "timings": get_render_timings(),
+        "shared_tiles": shared_cache.get_stats() if shared_cache else None,
+        "assets": get_asset_stats(),
+    }
+
+# Describe the most important numbers of `get_render_stats` in a single line, for logging
+def summarize_render_stats(stats: dict[str, Any]) -> str:
+    parts = [
+        f"{stats['running']}/{stats['max_workers']} workers busy, {stats['queued']} queued, "
+        f"{stats['completed']} completed",
+    ]
+    for name, priority in stats["priorities"].items():
+        wait = priority["wait"]
+        avg_wait = wait["sum_ms"] / wait["count"] if wait["count"] else 0
+        parts.append(f"{name} {priority['completed']} done, avg wait {avg_wait:.1f}ms")
+
+    flights = stats["single_flight"]
+    parts.append(f"{flights['saved']}/{flights['calls']} renders shared")
+
+    for name, cache in stats["timings"]["caches"].items():
+        parts.append(f"{name} cache {cache['hit_rate']:.0%} hits")
+
+    stores = [stats["assets"]["store"], *(stats["assets"]["worker_stores"] or {}).values()]
+    decoded_mb = sum(store["size_mb"] for store in stores if store)
+    if decoded_mb:
+        parts.append(f"{decoded_mb:.1f} MB of decoded assets")
+
+    shared_tiles = stats["shared_tiles"]
+    if shared_tiles:
+        hit_rates = ", ".join(
+            f"{pid}={process['hit_rate']:.0%}"
+            for pid, process in shared_tiles["processes"].items()
+            if process["hit_rate"] is not None
         )
+        parts.append(f"shared tiles {shared_tiles['used']}/{shared_tiles['slots']} slots, hits {hit_rates or '-'}")
+
+    return "; ".join(parts)
+
+class RenderPriority(IntEnum):
+    # Renders that a user is waiting on to respond to their interaction
+    INTERACTIVE = 0
+    # Everything else, such as updating the public game message
+    BACKGROUND = 1
+
+RENDER_PRIORITY: ContextVar[RenderPriority] = ContextVar("render_priority", default=RenderPriority.BACKGROUND)
+
+# Also applies to renders started by tasks created within this block
+@contextlib.contextmanager
+def render_priority(priority: RenderPriority):
+    token = RENDER_PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        RENDER_PRIORITY.reset(token)
+
+# Hands render jobs to the render executor in order of priority, then of submission
+class RenderScheduler:
+    def __init__(self, max_running: int):
+        self.max_running = max_running
+        self.num_running = 0
+        self._queue: list[tuple[RenderPriority, int, float, asyncio.Future, Callable[..., Any], tuple, bool]] = []
+        self._counter = itertools.count()
+        self._num_completed = dict.fromkeys(RenderPriority, 0)
+        self._wait_times = {priority: Histogram() for priority in RenderPriority}
+
+    async def run(self, fn: Callable[..., T], *args: Any, priority: RenderPriority | None = None) -> T:
+        if priority is None:
+            priority = RENDER_PRIORITY.get()
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._counter), time.perf_counter(), fut, fn, args, False))
+        fut.add_done_callback(self._on_cancelled)
+        self._dispatch()
+        return await fut
+
+    def _on_cancelled(self, fut: asyncio.Future):
+        if fut.cancelled():
+            queue = [entry for entry in self._queue if entry[3] is not fut]
+            if len(queue) != len(self._queue):
+                heapq.heapify(queue)
+                self._queue = queue
+
+    def _dispatch(self):
+        while self.num_running < self.max_running and self._queue:
+            entry = heapq.heappop(self._queue)
+            priority, counter, queued_at, fut, fn, args, retried = entry
+            if fut.done():
+                # Cancelled while still queued
+                continue
+            if not retried:
+                self._wait_times[priority].observe((time.perf_counter() - queued_at) * 1000)
+            self.num_running += 1
+            executor = get_render_executor()
+            try:
+                job = asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            except Exception as exc:
+                self.num_running -= 1
+                if isinstance(exc, BrokenProcessPool):
+                    reset_render_executor(executor)
+                    if not retried:
+                        heapq.heappush(self._queue, (priority, counter, queued_at, fut, fn, args, True))
+                        continue
+                fut.set_exception(exc)
+                continue
+            job.add_done_callback(functools.partial(self._on_done, entry, executor))
+
+    def _on_done(
+        self,
+        entry: tuple[RenderPriority, int, float, asyncio.Future, Callable[..., Any], tuple, bool],
+        executor: RenderExecutor | RenderProcessExecutor,
+        job: asyncio.Future,
+    ):
+        priority, counter, queued_at, fut, fn, args, retried = entry
+        self.num_running -= 1
+        if not job.cancelled() and isinstance(job.exception(), BrokenProcessPool):
+            reset_render_executor(executor)
+            if not retried and not fut.done():
+                logging.warning("A render worker died, retrying %s", getattr(fn, "__name__", fn))
+                heapq.heappush(self._queue, (priority, counter, queued_at, fut, fn, args, True))
+                self._dispatch()
+                return
+
+        self._num_completed[priority] += 1
+        if not fut.done():
+            if job.cancelled():
+                fut.cancel()
+            elif (exc := job.exception()) is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(job.result())
+        self._dispatch()
+
+    def get_stats(self):
+        queued = dict.fromkeys(RenderPriority, 0)
+        for priority, *_ in self._queue:
+            queued[priority] += 1
+        return {
+            priority.name.lower(): {
+                "queued": queued[priority],
+                "completed": self._num_completed[priority],
+                "wait": self._wait_times[priority].to_dict(),
+            }
+            for priority in RenderPriority
+        }
+
+_RENDER_SCHEDULER: RenderScheduler | None = None
+def get_render_scheduler() -> RenderScheduler:
+    global _RENDER_SCHEDULER
+    if not _RENDER_SCHEDULER:
+        _RENDER_SCHEDULER = RenderScheduler(get_render_executor().max_workers)
+    return _RENDER_SCHEDULER
+
+# Run a render function inside of the render executor, with the priority set by `render_priority`
+async def run_render(fn: Callable[..., bytes], *args: Any) -> bytes:
+    return await get_render_scheduler().run(fn, *args)
+
+# Lets concurrent callers asking for the same key share a single call
+class SingleFlight:
+    def __init__(self):
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self.num_calls = 0
+        self.num_saved = 0
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        self.num_calls += 1
+        task = self._tasks.get(key)
+        if task is not None:
+            self.num_saved += 1
+        else:
+            # Run the call in its own task, so that it is not cancelled
+            # along with whichever caller happened to start it
+            task = self._tasks[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    def get_stats(self):
+        return {
+            "calls": self.num_calls,
+            "renders": self.num_calls - self.num_saved,
+            "saved": self.num_saved,
+            "in_flight": len(self._tasks),
+        }
+
+RENDER_FLIGHTS = SingleFlight()
+
+SheetKey: TypeAlias = tuple[tuple[TileKey, ...], int, bool]
+# The sheets on a board, and the tile key of its offer and whether it is shown at all
+BoardKey: TypeAlias = tuple[tuple[SheetKey, ...], TileKey | None, bool]
+
+# Encoded offer sheets and boards, bounded by their total size in bytes
+SHEET_CACHE: LRUCache[SheetKey | BoardKey, RenderedImage] = LRUCache(
+    maxsize=get_config().images.sheet_cache_size_mb * 1024 * 1024,
+    getsizeof=lambda image: len(image.data),
+)
+SHEET_CACHE_LOCK = threading.Lock()
+
+def get_cached_sheet(key: SheetKey | BoardKey) -> RenderedImage | None:
+    with SHEET_CACHE_LOCK:
+        image = SHEET_CACHE.get(key)
+    record_cache_lookup("sheet", image is not None)
+    return image
+
+def set_cached_sheet(key: SheetKey | BoardKey, image: RenderedImage):
+    with SHEET_CACHE_LOCK:
+        try:
+            SHEET_CACHE[key] = image
+        except ValueError:
+            pass  # value too large
+
+
+# The last composed offer sheets of a team, updated in place as offers are added
+class OfferSheet:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._sheets: dict[bool, tuple[tuple[int, int, int], tuple[TileKey, ...], Image.Image]] = {}
+
+    # Bring the sheet up to date. Hold `lock` for as long as the canvas is used
+    def compose(self, tile_keys: Sequence[TileKey], maxsize: int, rowsize: int = 3, grayscaled: bool = False):
+        if len(tile_keys) > maxsize:
+            raise ValueError("Amount of images exceeds max size")
+
+        tile_keys = tuple(tile_keys)
+        board = (maxsize, rowsize, get_num_slots(len(tile_keys), maxsize, rowsize))
+        prev = self._sheets.get(grayscaled)
+        if prev and prev[0] == board and tile_keys[:len(prev[1])] == prev[1]:
+            _, prev_tile_keys, canvas = prev
+            ims = [
+                get_tile_image(tile_keys[i], grayscaled=grayscaled)
+                for i in range(len(prev_tile_keys), len(tile_keys))
+            ]
+            with timed_stage("stack"):
+                for i, im in enumerate(ims, len(prev_tile_keys)):
+                    canvas.paste(im, get_slot_coords(i, rowsize))
+        else:
+            canvas = compose_sheet(tile_keys, maxsize, rowsize, grayscaled=grayscaled)
+
+        self._sheets[grayscaled] = (board, tile_keys, canvas)
+        return canvas
+
+    def render(self, tile_keys: Sequence[TileKey], maxsize: int, rowsize: int = 3, grayscaled: bool = False) -> bytes:
+        with self.lock:
+            return encode_image(self.compose(tile_keys, maxsize, rowsize, grayscaled))
+
+OFFER_SHEETS: LRUCache[Hashable, OfferSheet] = LRUCache(maxsize=16)
+OFFER_SHEETS_LOCK = threading.Lock()
+
+def get_offer_sheet(sheet_id: Hashable):
+    with OFFER_SHEETS_LOCK:
+        sheet = OFFER_SHEETS.get(sheet_id)
+        if sheet is None:
+            sheet = OFFER_SHEETS[sheet_id] = OfferSheet()
+        return sheet
+
+# Clear all in-memory caches of this process, for instance to measure cold renders
+def clear_caches():
+    with MAP_IMAGE_CACHE_LOCK:
+        MAP_IMAGE_CACHE.clear()
+    with SHEET_CACHE_LOCK:
+        SHEET_CACHE.clear()
+    with OFFER_SHEETS_LOCK:
+        OFFER_SHEETS.clear()
+    with SINGLE_OFFER_CACHE_LOCK:
+        SINGLE_OFFER_CACHE.clear()
+    for func in (
+        get_font, get_faction_icon, get_environment_icon, get_placeholder, get_empty_board,
+        get_tacmap_layer, get_factions_layer, get_layout_layer, get_environment_layer,
+    ):
+        func.cache_clear() # type: ignore
+
+def compose_sheet(tile_keys: Sequence[TileKey], maxsize: int, rowsize: int = 3, grayscaled: bool = False):
+    # Images are rendered one after the other. This already runs inside of
+    # the render executor, which bounds how many renders happen at once.
+    if use_numpy():
+        ims = [get_tile_image(key) for key in tile_keys]
+        return stack_in_rows_numpy(ims, maxsize=maxsize, rowsize=rowsize, grayscaled=grayscaled)
     else:
-        im = get_placeholder()
-    fp = BytesIO()
-    im.save(fp, "png")
-    fp.seek(0)
-    return fp
+        ims = [get_tile_image(key, grayscaled=grayscaled) for key in tile_keys]
+        return stack_in_rows(ims, maxsize=maxsize, rowsize=rowsize, grayscaled=grayscaled)
+
+def render_offers(
+    tile_keys: Sequence[TileKey],
+    max_num_offers: int,
+    grayscaled: bool = False,
+    sheet_id: Hashable | None = None,
+) -> bytes:
+    with render_trace(f"offer sheet of {len(tile_keys)}/{max_num_offers} offers"):
+        if sheet_id is not None:
+            return get_offer_sheet(sheet_id).render(tile_keys, max_num_offers, grayscaled=grayscaled)
+
+        im = compose_sheet(tile_keys, max_num_offers, grayscaled=grayscaled)
+        return encode_image(im)
 
+# Render the offers of a team onto a sheet
+async def offers_to_image(
+    offers: Sequence['Offer'],
+    max_num_offers: int,
+    grayscaled: bool = False,
+    flip_sides: bool = False,
+    sheet_id: Hashable | None = None,
+):
+    # Which side an accepted offer was played on is part of its tile key, so
+    # `flip_sides` does not need to be part of the sheet key separately.
+    tile_keys = tuple(offer_to_tile_key(offer, flip_sides) for offer in offers)
+    key: SheetKey = (tile_keys, max_num_offers, grayscaled)
+    image = get_cached_sheet(key)
+    if image is None:
+        async def _render():
+            data = await run_render(render_offers, tile_keys, max_num_offers, grayscaled, sheet_id)
+            image = RenderedImage.create(key, data)
+            set_cached_sheet(key, image)
+            return image
+        image = await RENDER_FLIGHTS.run(("sheet", key), _render)
+    return image
+
+# Stack offer sheets on top of each other, with a single offer centered next to them
+def compose_board(sheets: Sequence[Image.Image], offer: Image.Image | None = None):
+    width = max(sheet.width for sheet in sheets)
+    height = sum(sheet.height for sheet in sheets) + IM_STACK_GAP_SIZE * (len(sheets) - 1)
+    if offer:
+        width += IM_STACK_GAP_SIZE + offer.width
+
+    with timed_stage("stack"):
+        canvas = Image.new(mode="RGBA", size=(width, height))
+        y = 0
+        for sheet in sheets:
+            canvas.paste(sheet, (0, y))
+            y += sheet.height + IM_STACK_GAP_SIZE
+        if offer:
+            canvas.paste(offer, (width - offer.width, (height - offer.height) // 2))
+    return canvas
+
+def render_board(
+    sheet_keys: Sequence[SheetKey],
+    sheet_ids: Sequence[Hashable | None],
+    offer_tile_key: TileKey | None = None,
+    show_offer: bool = True,
+) -> bytes:
+    with render_trace(f"board of {len(sheet_keys)} sheets"):
+        with contextlib.ExitStack() as stack:
+            sheets: list[Image.Image] = []
+            for (tile_keys, max_num_offers, grayscaled), sheet_id in zip(sheet_keys, sheet_ids):
+                if sheet_id is None:
+                    sheets.append(compose_sheet(tile_keys, max_num_offers, grayscaled=grayscaled))
+                else:
+                    # The sheets are pasted onto the board before any other
+                    # render can modify them
+                    sheet = get_offer_sheet(sheet_id)
+                    stack.enter_context(sheet.lock)
+                    sheets.append(sheet.compose(tile_keys, max_num_offers, grayscaled=grayscaled))
+
+            # Drawn at the size it has as a thumbnail in the separate layout
+            offer: Image.Image | None
+            if not show_offer:
+                offer = None
+            elif offer_tile_key:
+                offer = get_tile_image(offer_tile_key, size=THUMBNAIL_SIZE)
+            else:
+                offer = get_placeholder(size=THUMBNAIL_SIZE)
+            im = compose_board(sheets, offer)
+        return encode_image(im)
+
+# Render the offer sheets of both teams and the current offer onto a single image
+async def board_to_image(
+    sheets: Sequence[tuple[Sequence['Offer'], int, bool, Hashable | None]],
+    flip_sides: bool = False,
+    offer_tile_key: TileKey | None = None,
+    show_offer: bool = True,
+):
+    sheet_keys = tuple(
+        (tuple(offer_to_tile_key(offer, flip_sides) for offer in offers), max_num_offers, grayscaled)
+        for offers, max_num_offers, grayscaled, _ in sheets
+    )
+    sheet_ids = tuple(sheet_id for *_, sheet_id in sheets)
+    key: BoardKey = (sheet_keys, offer_tile_key, show_offer)
+    image = get_cached_sheet(key)
+    if image is None:
+        async def _render():
+            data = await run_render(render_board, sheet_keys, sheet_ids, offer_tile_key, show_offer)
+            image = RenderedImage.create(key, data)
+            set_cached_sheet(key, image)
+            return image
+        image = await RENDER_FLIGHTS.run(("board", key), _render)
+    return image
+
+SINGLE_OFFER_CACHE: LRUCache[tuple[TileKey | None, int], RenderedImage] = LRUCache(maxsize=256)
+SINGLE_OFFER_CACHE_LOCK = threading.Lock()
+
+def render_single_offer(tile_key: TileKey | None, size: int = IM_SIZE) -> bytes:
+    with render_trace(f"single offer {tile_key} at {size}px"):
+        if tile_key:
+            im = get_tile_image(tile_key, size=size)
+        else:
+            im = get_placeholder(size=size)
+        return encode_image(im)
+
+# Render a single map image
 async def get_single_offer_image(
     details: MapDetails | None = None,
     layout: LayoutType | None = None,
     environment: Environment | None = None,
     selected_team_id: Literal[1, 2] | None = None,
+    size: int = IM_SIZE,
 ):
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(
-        None, get_single_offer_image_sync,
-        details, layout, environment, selected_team_id
-    )
+    tile_key = get_tile_key(details, layout, environment, selected_team_id) if details else None
+    key = (tile_key, size)
+    with SINGLE_OFFER_CACHE_LOCK:
+        image = SINGLE_OFFER_CACHE.get(key)
+    record_cache_lookup("single_offer", image is not None)
+    if image is None:
+        async def _render():
+            data = await run_render(render_single_offer, tile_key, size)
+            image = RenderedImage.create(key, data)
+            with SINGLE_OFFER_CACHE_LOCK:
+                SINGLE_OFFER_CACHE[key] = image
+            return image
+        image = await RENDER_FLIGHTS.run(("single", key), _render)
+    return image
@@ -0,0 +1,257 @@
+import atexit
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import struct
+from typing import cast
+import weakref
+
+from PIL import Image
+
+SHARED_CACHE_MAGIC = b"DPSC"
+SHARED_CACHE_ALIGN = 64
+# Magic, amount of slots, slot size, amount of process entries and the LRU clock
+SHARED_CACHE_HEADER = struct.Struct("<4sIIIQ")
+SLOT_KEY_SIZE = 16
+# Last used, width, height, mode and how many handed out images still refer to it
+SLOT_META = struct.Struct("<QII4sI")
+# The PID of a process, and its amount of hits, misses, writes, evictions and lock timeouts
+PROCESS_STATS = struct.Struct("<QQQQQQ")
+# Lookups and writes give up after this many seconds, rather than stalling a
+# render for as long as another process holds the lock, or forever if that
+# process died while holding it
+LOCK_TIMEOUT = 0.05
+
+def _is_alive(pid: int):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# A cache of decoded images in shared memory, used by all render processes
+class SharedTileCache:
+    def __init__(self, shm: shared_memory.SharedMemory, lock, owner: bool = False):
+        self._shm = shm
+        buf = shm.buf
+        assert buf is not None
+        self._buf: memoryview = buf
+        # Reentrant, since images may be garbage collected, and their slots
+        # released, while the lock is held by the same thread
+        self._lock = lock
+        self._owner = owner
+        magic, self.num_slots, self.slot_size, self.max_processes, _ = SHARED_CACHE_HEADER.unpack_from(self._buf)
+        if magic != SHARED_CACHE_MAGIC:
+            raise ValueError("Not a shared tile cache")
+
+        self._keys_offset = SHARED_CACHE_HEADER.size
+        self._meta_offset = self._keys_offset + self.num_slots * SLOT_KEY_SIZE
+        self._stats_offset = self._meta_offset + self.num_slots * SLOT_META.size
+        data_offset = self._stats_offset + self.max_processes * PROCESS_STATS.size
+        self._data_offset = data_offset + (-data_offset % SHARED_CACHE_ALIGN)
+        self._stats_idx: int | None = None
+        self._timed_out = False
+
+    @staticmethod
+    def get_size(num_slots: int, slot_size: int, max_processes: int):
+        size = (
+            SHARED_CACHE_HEADER.size
+            + num_slots * (SLOT_KEY_SIZE + SLOT_META.size)
+            + max_processes * PROCESS_STATS.size
+        )
+        return size + (-size % SHARED_CACHE_ALIGN) + num_slots * slot_size
+
+    # Create a new cache
+    @classmethod
+    def create(cls, num_slots: int, slot_size: int, max_processes: int):
+        size = cls.get_size(num_slots, slot_size, max_processes)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        assert shm.buf is not None
+        # New shared memory is zeroed, which marks every slot as empty
+        SHARED_CACHE_HEADER.pack_into(shm.buf, 0, SHARED_CACHE_MAGIC, num_slots, slot_size, max_processes, 0)
+        self = cls(shm, multiprocessing.get_context("spawn").RLock(), owner=True)
+        atexit.register(self.close)
+        return self
+
+    @classmethod
+    def attach(cls, name: str, lock):
+        return cls(shared_memory.SharedMemory(name=name), lock)
+
+    # Get what another process needs to `attach` to this cache
+    def get_handle(self):
+        return self._shm.name, self._lock
+
+    def close(self):
+        if self._owner:
+            self._owner = False
+            self._shm.unlink()
+
+    @property
+    def nbytes(self):
+        return self._shm.size
+
+    def _find(self, key: bytes) -> int | None:
+        keys = bytes(self._buf[self._keys_offset:self._meta_offset])
+        pos = keys.find(key)
+        while pos >= 0:
+            if pos % SLOT_KEY_SIZE == 0:
+                return pos // SLOT_KEY_SIZE
+            pos = keys.find(key, pos + 1)
+        return None
+
+    def _tick(self) -> int:
+        header = SHARED_CACHE_HEADER.unpack_from(self._buf)
+        clock = header[-1] + 1
+        SHARED_CACHE_HEADER.pack_into(self._buf, 0, *header[:-1], clock)
+        return clock
+
+    def _get_meta(self, idx: int):
+        return SLOT_META.unpack_from(self._buf, self._meta_offset + idx * SLOT_META.size)
+
+    def _set_meta(self, idx: int, last_used: int, width: int, height: int, mode: bytes, pins: int):
+        SLOT_META.pack_into(self._buf, self._meta_offset + idx * SLOT_META.size, last_used, width, height, mode, pins)
+
+    # Add to one of this process's counters. The lock must be held
+    def _count(self, field: int, amount: int = 1):
+        if self._stats_idx is None:
+            pid = os.getpid()
+            for i in range(self.max_processes):
+                entry_pid = PROCESS_STATS.unpack_from(self._buf, self._stats_offset + i * PROCESS_STATS.size)[0]
+                if entry_pid == 0 or entry_pid == pid or not _is_alive(entry_pid):
+                    PROCESS_STATS.pack_into(self._buf, self._stats_offset + i * PROCESS_STATS.size, pid, 0, 0, 0, 0, 0)
+                    self._stats_idx = i
+                    break
+            else:
+                return
+
+        offset = self._stats_offset + self._stats_idx * PROCESS_STATS.size
+        stats = list(PROCESS_STATS.unpack_from(self._buf, offset))
+        stats[field] += amount
+        PROCESS_STATS.pack_into(self._buf, offset, *stats)
+
+    def _acquire(self):
+        if self._lock.acquire(timeout=LOCK_TIMEOUT):
+            return True
+        if not self._timed_out:
+            self._timed_out = True
+            logging.warning("Timed out waiting for the shared tile cache, skipping it")
+        # Only this process writes to its own counters, once it has them
+        if self._stats_idx is not None:
+            offset = self._stats_offset + self._stats_idx * PROCESS_STATS.size
+            stats = list(PROCESS_STATS.unpack_from(self._buf, offset))
+            stats[5] += 1
+            PROCESS_STATS.pack_into(self._buf, offset, *stats)
+        return False
+
+    # Get an image of a slot
+    def _view(self, idx: int, width: int, height: int, mode: str):
+        start = self._data_offset + idx * self.slot_size
+        size = width * height * Image.getmodebands(mode)
+        im = Image.frombuffer(mode, (width, height), cast(bytes, self._buf[start:start + size]), "raw", mode, 0, 1)
+        weakref.finalize(im, self._unpin, idx)
+        return im
+
+    def _unpin(self, idx: int):
+        # On a timeout the slot stays pinned, like it would if this process died
+        if not self._acquire():
+            return
+        try:
+            last_used, width, height, mode, pins = self._get_meta(idx)
+            self._set_meta(idx, last_used, width, height, mode, max(0, pins - 1))
+        finally:
+            self._lock.release()
+
+    def get(self, key: bytes) -> Image.Image | None:
+        if not self._acquire():
+            return None
+        try:
+            idx = self._find(key)
+            if idx is None:
+                self._count(2)
+                return None
+
+            _, width, height, mode, pins = self._get_meta(idx)
+            self._set_meta(idx, self._tick(), width, height, mode, pins + 1)
+            self._count(1)
+        finally:
+            self._lock.release()
+        return self._view(idx, width, height, mode.decode().strip())
+
+    # Store an image, unless another process already stored one under the same key
+    def put(self, key: bytes, im: Image.Image) -> Image.Image | None:
+        size = im.width * im.height * Image.getmodebands(im.mode)
+        if size > self.slot_size or len(im.mode) > 4:
+            return None
+
+        data = im.tobytes()
+        if not self._acquire():
+            return None
+        try:
+            idx = self._find(key)
+            if idx is not None:
+                _, width, height, mode, pins = self._get_meta(idx)
+                self._set_meta(idx, self._tick(), width, height, mode, pins + 1)
+                return self._view(idx, width, height, mode.decode().strip())
+
+            idx = None
+            oldest = None
+            for i in range(self.num_slots):
+                last_used, width, _, _, pins = self._get_meta(i)
+                if width == 0:
+                    idx = i
+                    oldest = None
+                    break
+                if pins == 0 and (oldest is None or last_used < oldest):
+                    idx = i
+                    oldest = last_used
+            if idx is None:
+                return None
+            if oldest is not None:
+                self._count(4)
+
+            start = self._data_offset + idx * self.slot_size
+            self._buf[start:start + size] = data
+            mode = im.mode.ljust(4).encode()
+            self._set_meta(idx, self._tick(), im.width, im.height, mode, 1)
+            key_offset = self._keys_offset + idx * SLOT_KEY_SIZE
+            self._buf[key_offset:key_offset + SLOT_KEY_SIZE] = key
+            self._count(3)
+        finally:
+            self._lock.release()
+        return self._view(idx, im.width, im.height, im.mode)
+
+    def get_stats(self):
+        # Read without the lock, so that this never waits on a render. The
+        # numbers may be off by the writes that happen meanwhile.
+        num_used = 0
+        num_pinned = 0
+        for i in range(self.num_slots):
+            _, width, _, _, pins = self._get_meta(i)
+            num_used += width != 0
+            num_pinned += pins != 0
+
+        processes = {}
+        for i in range(self.max_processes):
+            pid, hits, misses, writes, evictions, lock_timeouts = PROCESS_STATS.unpack_from(
+                self._buf, self._stats_offset + i * PROCESS_STATS.size,
+            )
+            if pid:
+                processes[pid] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": hits / (hits + misses) if hits + misses else None,
+                    "writes": writes,
+                    "evictions": evictions,
+                    "lock_timeouts": lock_timeouts,
+                }
+
+        return {
+            "slots": self.num_slots,
+            "used": num_used,
+            "pinned": num_pinned,
+            "size_mb": self.nbytes / 1024 / 1024,
+            "processes": processes,
+        }
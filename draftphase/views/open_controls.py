@@ -2,12 +2,16 @@ import asyncio
 import random
 from re import Match
 from typing import Literal, Sequence
-from discord import AllowedMentions, ButtonStyle, Embed, File, Interaction, NotFound, SelectOption, TextChannel, ui, InteractionMessage, Member
+from discord import AllowedMentions, ButtonStyle, Embed, File, Interaction, Message, NotFound, SelectOption, TextChannel, ui, InteractionMessage, Member
 from draftphase.bot import DISCORD_BOT
-from draftphase.discord_utils import CustomException, GameStateError, MessagePayload, View, handle_error_wrap
+from draftphase.discord_utils import (
+    CustomException, GameStateError, MessagePayload, View, forget_attachments, get_file_digests,
+    handle_error_wrap, remember_attachments, reuse_attachments,
+)
 from draftphase.embeds import get_single_offer_embed
 from draftphase.emojis import faction_to_emoji, layout_to_emoji
 from draftphase.game import Game
+from draftphase.images import RenderPriority, render_priority
 from draftphase.maps import MAPS, get_all_layout_combinations, get_layout_from_filtered_idx
 from draftphase.utils import SingletonMeta, safe_create_task
 
@@ -647,7 +651,7 @@ class ControlsView(View):
                 "embeds": [embed],
                 "view": self,
             },
-            [file]
+            [file] if file else []
         )
 
     async def _get_payload_draft_offer(self) -> tuple[MessagePayload, Sequence[File]]:
@@ -754,7 +758,7 @@ class ControlsView(View):
                 "embeds": [embed],
                 "view": self,
             },
-            [file]
+            [file] if file else []
         )
 
     def _get_payload_choose_advantage(self) -> MessagePayload:
@@ -806,18 +810,30 @@ class ControlsView(View):
             return await self._get_payload_draft_offer()
     
     async def send(self, interaction: Interaction):
-        payload, files = await self.get_payload()
+        with render_priority(RenderPriority.INTERACTIVE):
+            payload, files = await self.get_payload()
+        digests = get_file_digests(files)
         await interaction.response.send_message(**payload, files=files, ephemeral=True)
         self.message = await interaction.original_response()
+        remember_attachments(self.message, digests)
         await ControlsManager().add_view(self)
 
     async def edit(self, *, interaction: Interaction | None = None):
         if not self.message:
             raise Exception("Unknown message")
 
-        payload, files = await self.get_payload()
+        # Renders for the user who is interacting go ahead of any others
+        with render_priority(RenderPriority.INTERACTIVE if interaction else RenderPriority.BACKGROUND):
+            payload, files = await self.get_payload()
         payload.setdefault("view", None) # type: ignore
+        attachments, digests = reuse_attachments(self.message.id, payload.get("embeds", []), files)
         if interaction:
-            await interaction.response.edit_message(**payload, attachments=files)
+            response = await interaction.response.edit_message(**payload, attachments=attachments)
+            message = response.resource if response else None
         else:
-            await self.message.edit(**payload, attachments=files)
+            message = await self.message.edit(**payload, attachments=attachments)
+
+        if isinstance(message, Message):
+            remember_attachments(message, digests)
+        else:
+            forget_attachments(self.message.id)
@@ -0,0 +1,114 @@
+"""Pre-render the assets used to draw map images into a single asset pack.
+
+Run from the root of the repository, next to your `config.yaml`:
+
+    python -m scripts.bake_assets
+
+This renders the tacmaps with their names drawn on, the faction and
+environment icons, and the layout overlays, at both the full and the
+thumbnail size. The results are written as raw RGBA to the file set by
+`images.asset_pack`, which the bot memory-maps when it starts. The layout
+emojis are written to `assets/emojis` along the way.
+
+Run it again whenever the assets or the maps in `config.yaml` change. The
+bot ignores an asset pack that is out of date.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+from pathlib import Path
+import time
+
+from draftphase.assets import PackedAsset, write_asset_pack
+from draftphase.config import Orientation, get_config
+from draftphase.images import (
+    IM_SIZE, THUMBNAIL_SIZE, get_assets_digest, get_environment_asset_name,
+    get_environment_icon, get_faction_asset_name, get_faction_icon, get_layout_asset_name,
+    get_layout_layer, get_tacmap_asset_name, get_tacmap_layer,
+)
+from draftphase.maps import ENVIRONMENTS, FACTIONS, LAYOUT_COMBINATIONS, MAPS
+from scripts.generate_layout_emojis import EMOJIS_DIR, iter_layout_emojis, save_layout_emoji
+
+SIZES = (IM_SIZE, THUMBNAIL_SIZE)
+
+def iter_jobs():
+    for size in SIZES:
+        for key in MAPS:
+            yield "tacmap", key, size
+        for key in FACTIONS:
+            yield "faction", key, size
+        for key in ENVIRONMENTS:
+            yield "environment", key, size
+        for orientation in Orientation:
+            for layout in LAYOUT_COMBINATIONS:
+                yield "layout", (layout, orientation), size
+
+def bake(kind: str, key, size: int) -> list[PackedAsset]:
+    if kind == "tacmap":
+        details = MAPS[key]
+        return [(get_tacmap_asset_name(details, size), get_tacmap_layer(details, size), (0, 0))]
+
+    elif kind == "faction":
+        faction = FACTIONS[key]
+        return [
+            (get_faction_asset_name(faction, selected, size), get_faction_icon(faction, selected, size), (0, 0))
+            for selected in (False, True)
+        ]
+
+    elif kind == "environment":
+        environment = ENVIRONMENTS[key]
+        return [(get_environment_asset_name(environment, size), get_environment_icon(environment, size), (0, 0))]
+
+    elif kind == "layout":
+        layout, orientation = key
+        im, dest = get_layout_layer(layout, orientation, size)
+        return [(get_layout_asset_name(layout, orientation, size), im, dest)]
+
+    raise ValueError(f"Unknown asset kind {kind}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", type=Path, help="The file to write the asset pack to, if not the one in the config")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="The number of processes to render with")
+    parser.add_argument("--force", action="store_true", help="Bake the assets even when the asset pack is up to date")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    output: Path | None = args.output or get_config().images.asset_pack
+    if not output:
+        parser.error("No asset pack is configured, pass --output instead")
+
+    digest = get_assets_digest()
+    if not args.force and output.exists():
+        from draftphase.assets import AssetPack
+        try:
+            if AssetPack(output).digest == digest:
+                logging.info("Asset pack %s is already up to date", output)
+                return
+        except (OSError, ValueError):
+            pass
+
+    start = time.monotonic()
+    jobs = list(iter_jobs())
+    EMOJIS_DIR.mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        emoji_futs = [pool.submit(save_layout_emoji, name, im) for name, im in iter_layout_emojis()]
+        results = pool.map(bake, *zip(*jobs), chunksize=8)
+        assets = [asset for result in results for asset in result]
+        for fut in emoji_futs:
+            fut.result()
+
+    write_asset_pack(output, digest, assets)
+    logging.info(
+        "Baked %s assets and %s layout emojis into %s (%.1f MB) in %.1fs",
+        len(assets),
+        len(emoji_futs),
+        output,
+        output.stat().st_size / 1024 / 1024,
+        time.monotonic() - start,
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+"""Benchmarks for the image renderer in `draftphase.images`.
+
+Run from the root of the repository, next to your `config.yaml`:
+
+    python -m scripts.benchmark_images suite --output bench.json
+    python -m scripts.benchmark_images encoding
+    python -m scripts.benchmark_images numpy
+    python -m scripts.benchmark_images game
+    python -m scripts.benchmark_images layout
+
+The suite covers the whole render pipeline for every map, and always
+reports its results as JSON, so that they can be compared over time.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable
+
+import PIL
+from PIL import Image
+
+from draftphase import images
+from draftphase.config import ImageEncoding, get_config
+from draftphase.game import Offer
+from draftphase.images import (
+    THUMBNAIL_SIZE, board_to_image, clear_caches, encode_image, get_asset_pack, get_disk_cache,
+    get_grayscale, get_map_image, get_render_executor, get_single_offer_image, get_tile_key,
+    offer_to_tile_key, offers_to_image, render_map_image, render_offers, render_single_offer,
+    stack_in_rows, stack_in_rows_numpy,
+)
+from draftphase.maps import LAYOUT_COMBINATIONS, MAPS
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ENCODING_PROFILES = {
+    "png": ImageEncoding(),
+    "png_fast": ImageEncoding(compress_level=1),
+    "png_quantized": ImageEncoding(quantize=True),
+    "webp": ImageEncoding(format="webp", compress_level=4),
+    "webp_lossless": ImageEncoding(format="webp", lossless=True, compress_level=4),
+}
+
+def timed(func: Callable[[], Any]) -> tuple[float, Any]:
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+# Get a map image and a full offer sheet for every map
+def get_sample_images() -> dict[str, list[Image.Image]]:
+    tiles = []
+    sheets = []
+    for i, details in enumerate(MAPS.values()):
+        layout = LAYOUT_COMBINATIONS[i % len(LAYOUT_COMBINATIONS)]
+        tile = get_map_image(details, layout, details.environments[0], None)
+        tiles.append(tile)
+        sheets.append(stack_in_rows([tile] * 5, maxsize=6))
+    return {"tile": tiles, "sheet": sheets}
+
+def benchmark_encoding():
+    samples = get_sample_images()
+    results: dict[str, dict[str, float]] = {}
+    for name, encoding in ENCODING_PROFILES.items():
+        result = results[name] = {}
+        for kind, ims in samples.items():
+            durations = []
+            sizes = []
+            for im in ims:
+                duration, data = timed(lambda: encode_image(im, encoding))
+                durations.append(duration)
+                sizes.append(len(data))
+            result[f"{kind}_encode_ms"] = statistics.mean(durations) * 1000
+            result[f"{kind}_size_kb"] = statistics.mean(sizes) / 1024
+    return results
+
+# Compare combining full offer sheets using Pillow and using NumPy
+def benchmark_numpy(repeat: int = 10):
+    tiles = get_sample_images()["tile"]
+    results: dict[str, dict[str, float]] = {}
+    for max_num_offers in (6, 12, 24):
+        ims = [tiles[i % len(tiles)] for i in range(max_num_offers)]
+        for grayscaled in (False, True):
+            def _pillow():
+                return stack_in_rows(
+                    [get_grayscale(im) for im in ims] if grayscaled else ims,
+                    maxsize=max_num_offers,
+                    grayscaled=grayscaled,
+                )
+            def _numpy():
+                return stack_in_rows_numpy(ims, maxsize=max_num_offers, grayscaled=grayscaled)
+
+            pillow_ms = statistics.mean(timed(_pillow)[0] for _ in range(repeat)) * 1000
+            numpy_ms = statistics.mean(timed(_numpy)[0] for _ in range(repeat)) * 1000
+            results[f"{max_num_offers}{'_grayscaled' if grayscaled else ''}"] = {
+                "pillow_ms": pillow_ms,
+                "numpy_ms": numpy_ms,
+                "speedup": pillow_ms / numpy_ms,
+            }
+    return results
+
+# Get the peak memory use of this process so far
+def get_peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, but in kilobytes everywhere else
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024
+    return peak / 1024
+
+def summarize(durations: list[float]):
+    if len(durations) > 1:
+        percentiles = statistics.quantiles(durations, n=100, method="inclusive")
+        p50, p95 = percentiles[49], percentiles[94]
+    else:
+        p50 = p95 = durations[0]
+    return {
+        "count": len(durations),
+        "p50_ms": p50 * 1000,
+        "p95_ms": p95 * 1000,
+        "throughput_per_s": len(durations) / sum(durations) if sum(durations) else None,
+        "peak_rss_mb": get_peak_rss_mb(),
+    }
+
+# Get a sequence of offers on every map in turn
+def get_sample_offers(num: int):
+    maps = list(MAPS.values())
+    offers = []
+    for i in range(num):
+        details = maps[i % len(maps)]
+        offers.append(Offer(
+            id=i,
+            game_id=0,
+            offer_no=i + 1,
+            team_id=0,
+            map=details.key,
+            environment=details.environments[i % len(details.environments)].key,
+            layout=LAYOUT_COMBINATIONS[i % len(LAYOUT_COMBINATIONS)],
+            accepted=None,
+        ))
+    return offers
+
+def benchmark_suite(repeat: int = 3):
+    results: dict[str, Any] = {
+        "environment": {
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "render_backend": get_config().images.render_backend,
+            "use_numpy": images.use_numpy(),
+            "encoding": get_config().images.encoding.model_dump(),
+            # With an asset pack, cold map images are only composited from
+            # baked layers, rather than rendered from the decoded assets
+            "asset_pack": get_asset_pack() is not None,
+        },
+    }
+
+    # All parameters of a map image, for every map
+    all_params = [
+        (details, LAYOUT_COMBINATIONS[i % len(LAYOUT_COMBINATIONS)], environment, None)
+        for details in MAPS.values()
+        for i, environment in enumerate(details.environments)
+    ]
+
+    # Map images rendered from scratch, without any cached layers
+    durations = []
+    for _ in range(repeat):
+        for params in all_params:
+            clear_caches()
+            durations.append(timed(lambda: render_map_image(*params))[0])
+    results["get_map_image_cold"] = summarize(durations)
+
+    # Map images loaded from the disk cache
+    if get_disk_cache():
+        for params in all_params:
+            get_map_image(*params)
+        durations = []
+        for _ in range(repeat):
+            for params in all_params:
+                clear_caches()
+                durations.append(timed(lambda: get_map_image(*params))[0])
+        results["get_map_image_disk"] = summarize(durations)
+
+    # Map images from the in-memory cache
+    for params in all_params:
+        get_map_image(*params)
+    durations = [
+        timed(lambda: get_map_image(*params))[0]
+        for _ in range(repeat)
+        for params in all_params
+    ]
+    results["get_map_image_warm"] = summarize(durations)
+
+    max_num_offers = get_config().bot.max_num_offers
+    tiles = get_sample_images()["tile"]
+    results["stack_in_rows"] = {}
+    for num in range(1, max_num_offers + 1):
+        ims = [tiles[i % len(tiles)] for i in range(num)]
+        durations = [
+            timed(lambda: stack_in_rows(ims, maxsize=max_num_offers))[0]
+            for _ in range(repeat)
+        ]
+        results["stack_in_rows"][num] = summarize(durations)
+
+    for grayscaled in (False, True):
+        # What the render executor runs for `offers_to_image`, without a
+        # sheet ID so that every sheet is composed from its map images
+        name = "render_offers_grayscaled" if grayscaled else "render_offers"
+        results[name] = {}
+        for num in range(1, max_num_offers + 1):
+            tile_keys = tuple(offer_to_tile_key(offer) for offer in get_sample_offers(num))
+            durations = [
+                timed(lambda: render_offers(tile_keys, max_num_offers, grayscaled))[0]
+                for _ in range(repeat)
+            ]
+            results[name][num] = summarize(durations)
+
+    for name, size in (
+        ("render_single_offer", images.IM_SIZE),
+        ("render_single_offer_thumbnail", images.THUMBNAIL_SIZE),
+    ):
+        durations = []
+        sizes = []
+        for _ in range(repeat):
+            for params in all_params:
+                duration, data = timed(lambda: render_single_offer(get_tile_key(*params), size))
+                durations.append(duration)
+                sizes.append(len(data))
+        results[name] = summarize(durations)
+        results[name]["size_kb"] = statistics.mean(sizes) / 1024
+
+    return results
+
+# Render all images of a game message, either one after the other or all at once
+def benchmark_game_message(repeat: int = 10, num_offers: int = 12):
+    max_num_offers = get_config().bot.max_num_offers
+    offers = get_sample_offers(num_offers)
+    # Offers alternate between both teams
+    team_offers = [offers[0::2], offers[1::2]]
+    last_offer = offers[-1]
+    last_offer_args = (
+        MAPS[last_offer.map],
+        last_offer.layout,
+        last_offer.get_environment(),
+        None,
+    )
+
+    def get_coros():
+        return [
+            *[
+                offers_to_image(team_offers[i], max_num_offers, grayscaled=(i == 1), sheet_id=("bench", i))
+                for i in range(2)
+            ],
+            get_single_offer_image(*last_offer_args, size=THUMBNAIL_SIZE),
+        ]
+
+    async def _sequential():
+        for coro in get_coros():
+            await coro
+
+    async def _concurrent():
+        await asyncio.gather(*get_coros())
+
+    async def _run():
+        results: dict[str, dict[str, float]] = {}
+        for name, func in (("sequential", _sequential), ("concurrent", _concurrent)):
+            durations = []
+            for _ in range(repeat):
+                clear_caches()
+                start = time.perf_counter()
+                await func()
+                durations.append(time.perf_counter() - start)
+            results[name] = {
+                "p50_ms": statistics.median(durations) * 1000,
+                "max_ms": max(durations) * 1000,
+                "workers": get_render_executor().max_workers,
+            }
+        return results
+
+    return asyncio.run(_run())
+
+# Compare the game message layouts over a whole game, with an edit for every offer
+def benchmark_layout(repeat: int = 3, num_offers: int = 12, upload_mbps: float = 10):
+    max_num_offers = get_config().bot.max_num_offers
+    offers = get_sample_offers(num_offers)
+
+    def get_edits():
+        # Offers alternate between both teams, and the team that is not
+        # offering is grayscaled
+        for i in range(1, num_offers + 1):
+            team_offers = [offers[:i][0::2], offers[:i][1::2]]
+            last_offer = offers[i - 1]
+            sheets = [
+                (team_offers[team_idx], max_num_offers, team_idx == i % 2, ("bench", team_idx))
+                for team_idx in range(2)
+            ]
+            yield sheets, last_offer
+
+    async def _separate(sheets, last_offer: Offer):
+        return await asyncio.gather(
+            *[
+                offers_to_image(offers, max_num_offers, grayscaled=grayscaled, sheet_id=sheet_id)
+                for offers, max_num_offers, grayscaled, sheet_id in sheets
+            ],
+            get_single_offer_image(
+                MAPS[last_offer.map], last_offer.layout, last_offer.get_environment(), None,
+                size=THUMBNAIL_SIZE,
+            ),
+        )
+
+    async def _combined(sheets, last_offer: Offer):
+        return [await board_to_image(sheets, offer_tile_key=offer_to_tile_key(last_offer))]
+
+    async def _run():
+        results: dict[str, dict[str, float]] = {}
+        for name, func in (("separate", _separate), ("combined", _combined)):
+            durations = []
+            sizes = []
+            num_files = []
+            for _ in range(repeat):
+                clear_caches()
+                for sheets, last_offer in get_edits():
+                    start = time.perf_counter()
+                    ims = await func(sheets, last_offer)
+                    durations.append(time.perf_counter() - start)
+                    sizes.append(sum(len(im.data) for im in ims))
+                    num_files.append(len(ims))
+
+            upload_ms = statistics.mean(sizes) * 8 / (upload_mbps * 1000 * 1000) * 1000
+            results[name] = {
+                "files_per_edit": statistics.mean(num_files),
+                "upload_kb": statistics.mean(sizes) / 1024,
+                "render_p50_ms": statistics.median(durations) * 1000,
+                "upload_est_ms": upload_ms,
+                "edit_est_ms": statistics.median(durations) * 1000 + upload_ms,
+            }
+        return results
+
+    return asyncio.run(_run())
+
+def print_table(results: dict[str, dict[str, float]]):
+    columns = list(next(iter(results.values())).keys())
+    print(" | ".join(["case".ljust(16), *[c.rjust(16) for c in columns]]))
+    for name, result in results.items():
+        print(" | ".join([name.ljust(16), *[f"{result[c]:16.1f}" for c in columns]]))
+
+BENCHMARKS = {
+    "suite": benchmark_suite,
+    "encoding": benchmark_encoding,
+    "numpy": benchmark_numpy,
+    "game": benchmark_game_message,
+    "layout": benchmark_layout,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=list(BENCHMARKS))
+    parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = BENCHMARKS[args.benchmark]()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.json or args.benchmark == "suite":
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+if __name__ == '__main__':
+    main()
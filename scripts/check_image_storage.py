@@ -0,0 +1,155 @@
+"""Checks for `draftphase.image_storage` against a stand-in storage channel,
+so that uploading, reusing, refreshing and re-uploading stored images can be
+tried without a bot token or a Discord server.
+
+Run from the root of the repository, next to your `config.yaml`:
+
+    python -m scripts.check_image_storage
+
+The stand-in channel signs its attachment URLs the way Discord's CDN does,
+with an `ex` parameter, and keeps track of how often it is asked to send and
+fetch messages. Stored images are kept in a temporary in-memory database
+rather than in `app.db`.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+import itertools
+import sqlite3
+from types import SimpleNamespace
+from typing import Any, cast
+
+import discord
+from discord import TextChannel
+
+from draftphase import db
+from draftphase.embeds import attach_image
+from draftphase.image_storage import ImageStorage, StoredImage, get_url_expiry
+from draftphase.images import RenderedImage
+
+URL_LIFETIME = timedelta(hours=24)
+
+class FakeAttachment:
+    def __init__(self, channel_id: int, message_id: int, filename: str):
+        self.filename = filename
+        expires_at = datetime.now(tz=timezone.utc) + URL_LIFETIME
+        self.url = (
+            f"https://cdn.discordapp.com/attachments/{channel_id}/{message_id}/{filename}"
+            f"?ex={int(expires_at.timestamp()):x}&is=0&hm={message_id:x}"
+        )
+
+class FakeMessage:
+    def __init__(self, channel: "FakeChannel", message_id: int, filenames: list[str]):
+        self.channel = channel
+        self.id = message_id
+        self.filenames = filenames
+        self.attachments = [FakeAttachment(channel.id, message_id, filename) for filename in filenames]
+
+# Stands in for the storage channel
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.messages: dict[int, list[str]] = {}
+        self.num_sends = 0
+        self.num_fetches = 0
+        self._ids = itertools.count(1000)
+
+    async def send(self, files: list[discord.File]):
+        self.num_sends += 1
+        message = FakeMessage(self, next(self._ids), [file.filename for file in files])
+        self.messages[message.id] = message.filenames
+        return message
+
+    async def fetch_message(self, message_id: int):
+        self.num_fetches += 1
+        if message_id not in self.messages:
+            response = cast(Any, SimpleNamespace(status=404, reason="Not Found"))
+            raise discord.NotFound(response, "Unknown Message")
+        return FakeMessage(self, message_id, self.messages[message_id])
+
+class FakeImageStorage(ImageStorage):
+    def __init__(self, channel: FakeChannel):
+        super().__init__(channel.id)
+        self.channel = channel
+
+    async def _get_channel(self) -> TextChannel:
+        return cast(TextChannel, self.channel)
+
+# Make every stored image look like its URL is about to expire
+def expire_all(images: dict[str, RenderedImage]):
+    for image in images.values():
+        stored = StoredImage.load(image.digest)
+        assert stored is not None
+        stored.expires_at = datetime.now(tz=timezone.utc)
+        stored.save()
+
+def check(description: str, condition: bool):
+    print(("ok    " if condition else "FAIL  ") + description)
+    if not condition:
+        raise SystemExit(1)
+
+async def run_checks():
+    db.DB_CONN = sqlite3.connect(":memory:")
+    db.create_tables()
+
+    channel = FakeChannel(42)
+    images = {
+        f"image{i}": RenderedImage.create(("check_image_storage", i), bytes([i]) * 64)
+        for i in range(12)
+    }
+
+    storage = FakeImageStorage(channel)
+    urls = await storage.get_urls(images)
+    check("all images are uploaded", set(urls) == {image.digest for image in images.values()})
+    check("images are uploaded 10 to a message", channel.num_sends == 2)
+    check(
+        "images are uploaded under their name",
+        all(f"/{image.get_file_name(name)}?" in urls[image.digest] for name, image in images.items()),
+    )
+    check("upload URLs are not expiring", all(
+        (expiry := get_url_expiry(url)) is not None and expiry > datetime.now(tz=timezone.utc)
+        for url in urls.values()
+    ))
+
+    check("stored images are reused", await storage.get_urls(images) == urls and channel.num_sends == 2)
+
+    storage = FakeImageStorage(channel)
+    check(
+        "stored images are loaded from the database",
+        await storage.get_urls(images) == urls and channel.num_sends == 2 and channel.num_fetches == 0,
+    )
+
+    expire_all(images)
+    storage = FakeImageStorage(channel)
+    refreshed = await storage.get_urls(images)
+    check("expiring URLs are refreshed by fetching their messages", channel.num_fetches == 2)
+    check("refreshing does not upload images again", channel.num_sends == 2)
+    check("refreshed URLs are stored", all(
+        not stored.is_expiring()
+        for image in images.values()
+        if (stored := StoredImage.load(image.digest))
+    ) and set(refreshed) == set(urls))
+
+    first_message_id = min(channel.messages)
+    del channel.messages[first_message_id]
+    expire_all(images)
+    storage = FakeImageStorage(channel)
+    reuploaded = await storage.get_urls(images)
+    check("images of deleted messages are uploaded again", channel.num_sends == 3)
+    check("all images still have a URL", set(reuploaded) == set(urls))
+    check("re-uploaded images are stored with their new message", all(
+        stored is not None and stored.message_id != first_message_id
+        for image in images.values()
+        if (stored := StoredImage.load(image.digest))
+    ))
+
+    name, image = next(iter(images.items()))
+    check(
+        "a message without images keeps the stored URL its embeds showed",
+        attach_image([], name, None, previous_urls=list(reuploaded.values())) == reuploaded[image.digest],
+    )
+
+def main():
+    asyncio.run(run_checks())
+
+if __name__ == '__main__':
+    main()
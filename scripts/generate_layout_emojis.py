@@ -1,9 +1,13 @@
 from enum import Enum
+from pathlib import Path
+from typing import Iterator
 from PIL import Image, ImageDraw
 from discord import Colour
 
 from draftphase.maps import get_all_layout_combinations
 
+EMOJIS_DIR = Path("assets/emojis")
+
 class Colors(Enum):
     BORDER = Colour(0x4c4642).to_rgb()
     BACKGROUND_NEUTRAL = Colour(0x918275).to_rgb()
@@ -12,7 +16,8 @@ class Colors(Enum):
     OBJECTIVE = Colour(0x32f11f).to_rgb()
 
 
-def main():
+# Get the name and image of the emoji of every layout, both vertical and horizontal
+def iter_layout_emojis() -> Iterator[tuple[str, Image.Image]]:
     im = Image.new(mode="RGB", size=(5,5), color=Colors.BORDER.value)
     draw = ImageDraw.Draw(im)
 
@@ -24,22 +29,29 @@ def main():
         im2 = im.copy()
         for row, obj in enumerate(layout, 1):
             im2.putpixel((obj+1, row), Colors.OBJECTIVE.value)
-        
-        im_name = "assets\\emojis\\obj_vert_" + "".join([str(i) for i in layout]) + ".png"
-        (
-            im2
-            .resize(size=(500, 500), resample=Image.Resampling.NEAREST)
-            .save(im_name, format="png")
-        )
 
-        im_name = "assets\\emojis\\obj_hor_" + "".join([str(i) for i in layout]) + ".png"
-        (
-            im2
-            .transpose(Image.Transpose.ROTATE_90)
-            .transpose(Image.Transpose.FLIP_TOP_BOTTOM)
-            .resize(size=(500, 500), resample=Image.Resampling.NEAREST)
-            .save(im_name, format="png")
+        layout_str = "".join([str(i) for i in layout])
+        yield (
+            "obj_vert_" + layout_str,
+            im2.resize(size=(500, 500), resample=Image.Resampling.NEAREST),
+        )
+        yield (
+            "obj_hor_" + layout_str,
+            (
+                im2
+                .transpose(Image.Transpose.ROTATE_90)
+                .transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+                .resize(size=(500, 500), resample=Image.Resampling.NEAREST)
+            ),
         )
 
+def save_layout_emoji(name: str, im: Image.Image, output_dir: Path = EMOJIS_DIR):
+    im.save(output_dir / f"{name}.png", format="png")
+
+def main():
+    EMOJIS_DIR.mkdir(parents=True, exist_ok=True)
+    for name, im in iter_layout_emojis():
+        save_layout_emoji(name, im)
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()